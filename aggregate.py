@@ -0,0 +1,193 @@
+#==============================================================================
+# SCORE AGGREGATION
+# Summarizes analysis_scores.csv locally before anything is sent to a model
+#==============================================================================
+
+from array import array
+import csv
+import math
+
+CRITERIA = ["Task clarity", "Actionability", "Priority clarity", "Timeframes", "Task breakdown"]
+Z_95 = 1.96
+
+def model_from_output_file(output_file):
+    """Recovers the model name from '{id}_{task}_{style}_{model}_{timestamp}.txt'."""
+    stem = output_file[:-4] if output_file.endswith('.txt') else output_file
+    parts = stem.rsplit('_', 2)
+    return parts[1] if len(parts) == 3 else 'unknown'
+
+def load_score_columns(csv_path):
+    """Parses the scores CSV once into columnar arrays.
+
+    Prompts and models are stored as small integer codes into a lookup list so
+    that grouping is a single pass over compact arrays.
+    """
+    columns = {
+        'prompts': [],
+        'models': [],
+        'prompt_codes': array('i'),
+        'model_codes': array('i'),
+        'totals': array('d'),
+        'criteria': [array('d') for _ in CRITERIA],
+        'prescore_pairs': [],
+    }
+    prompt_index = {}
+    model_index = {}
+
+    with open(csv_path, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            try:
+                scores = [float(x) for x in row['Score String'].split(',')]
+                total = float(row['Total Score'])
+            except (KeyError, ValueError):
+                continue
+            if len(scores) != len(CRITERIA):
+                continue
+
+            prompt_name = row['Prompt']
+            model = model_from_output_file(row['Output File'])
+            if prompt_name not in prompt_index:
+                prompt_index[prompt_name] = len(columns['prompts'])
+                columns['prompts'].append(prompt_name)
+            if model not in model_index:
+                model_index[model] = len(columns['models'])
+                columns['models'].append(model)
+
+            columns['prompt_codes'].append(prompt_index[prompt_name])
+            columns['model_codes'].append(model_index[model])
+            columns['totals'].append(total)
+            for column, score in zip(columns['criteria'], scores):
+                column.append(score)
+            if row.get('Pre-score'):
+                columns['prescore_pairs'].append((float(row['Pre-score']), total))
+
+    return columns
+
+def _stats(count, total, total_sq):
+    """Mean, sample variance and 95% confidence interval from running sums."""
+    if count == 0:
+        return {'n': 0, 'mean': 0.0, 'var': 0.0, 'ci_low': 0.0, 'ci_high': 0.0}
+    mean = total / count
+    var = max(total_sq - count * mean * mean, 0.0) / (count - 1) if count > 1 else 0.0
+    half_width = Z_95 * math.sqrt(var / count)
+    return {'n': count, 'mean': mean, 'var': var, 'ci_low': mean - half_width, 'ci_high': mean + half_width}
+
+def _group_stats(codes, values, labels):
+    counts = [0] * len(labels)
+    sums = [0.0] * len(labels)
+    sums_sq = [0.0] * len(labels)
+    for code, value in zip(codes, values):
+        counts[code] += 1
+        sums[code] += value
+        sums_sq[code] += value * value
+    return {label: _stats(counts[i], sums[i], sums_sq[i]) for i, label in enumerate(labels)}
+
+def _ranks(values):
+    """Ranks starting at 1, with tied values sharing their average rank."""
+    order = sorted(range(len(values)), key=values.__getitem__)
+    ranks = [0.0] * len(values)
+    start = 0
+    while start < len(order):
+        end = start
+        while end + 1 < len(order) and values[order[end + 1]] == values[order[start]]:
+            end += 1
+        for i in range(start, end + 1):
+            ranks[order[i]] = (start + end) / 2 + 1
+        start = end + 1
+    return ranks
+
+def prescore_agreement(pairs):
+    """How well structural pre-scores track critic totals over (pre-score, total) pairs.
+
+    Returns the Spearman rank correlation (None if either side is constant)
+    and the mean absolute difference, both scores being on the 5-25 scale.
+    """
+    count = len(pairs)
+    if count == 0:
+        return {'n': 0, 'spearman': None, 'mean_abs_diff': 0.0}
+    prescores, totals = _ranks([p for p, _ in pairs]), _ranks([t for _, t in pairs])
+    mean = (count + 1) / 2
+    covariance = sum((a - mean) * (b - mean) for a, b in zip(prescores, totals))
+    spread = math.sqrt(sum((a - mean) ** 2 for a in prescores) * sum((b - mean) ** 2 for b in totals))
+    return {
+        'n': count,
+        'spearman': covariance / spread if spread else None,
+        'mean_abs_diff': sum(abs(p - t) for p, t in pairs) / count,
+    }
+
+def format_agreement(agreement):
+    rho = "n/a" if agreement['spearman'] is None else f"{agreement['spearman']:.2f}"
+    return (f"Pre-score vs critic: {agreement['n']} outputs, Spearman rho {rho}, "
+            f"mean absolute difference {agreement['mean_abs_diff']:.2f}")
+
+def summarize_scores(columns):
+    """Computes overall, per-prompt, per-model, per-criterion and prompt x model tables."""
+    prompts = columns['prompts']
+    models = columns['models']
+    totals = columns['totals']
+
+    overall = _stats(len(totals), sum(totals), sum(x * x for x in totals))
+    by_criterion = {
+        name: _stats(len(column), sum(column), sum(x * x for x in column))
+        for name, column in zip(CRITERIA, columns['criteria'])
+    }
+
+    # Encode each (prompt, model) pair as one integer so it groups like any other column
+    pair_labels = [(p, m) for p in prompts for m in models]
+    pair_codes = array('i', (p * len(models) + m for p, m in zip(columns['prompt_codes'], columns['model_codes'])))
+    interaction = {
+        pair: stats
+        for pair, stats in _group_stats(pair_codes, totals, pair_labels).items()
+        if stats['n']
+    }
+
+    criterion_by_prompt = {
+        name: _group_stats(columns['prompt_codes'], column, prompts)
+        for name, column in zip(CRITERIA, columns['criteria'])
+    }
+
+    return {
+        'overall': overall,
+        'by_prompt': _group_stats(columns['prompt_codes'], totals, prompts),
+        'by_model': _group_stats(columns['model_codes'], totals, models),
+        'by_criterion': by_criterion,
+        'criterion_by_prompt': criterion_by_prompt,
+        'prompt_x_model': interaction,
+        'prescore_agreement': prescore_agreement(columns['prescore_pairs']),
+    }
+
+def _format_table(title, rows):
+    lines = [title, f"  {'group':<52} {'n':>7} {'mean':>7} {'var':>7}   95% CI"]
+    for label, stats in rows:
+        lines.append(
+            f"  {label:<52} {stats['n']:>7} {stats['mean']:>7.2f} {stats['var']:>7.2f}"
+            f"   [{stats['ci_low']:.2f}, {stats['ci_high']:.2f}]"
+        )
+    return "\n".join(lines)
+
+def format_summary(summary):
+    """Renders the summary tables as compact plain text."""
+    overall = summary['overall']
+    sections = [
+        f"Scored outputs: {overall['n']}, mean total score {overall['mean']:.2f} "
+        f"(95% CI {overall['ci_low']:.2f}-{overall['ci_high']:.2f}, max {5 * len(CRITERIA)})",
+        _format_table("Total score by prompt:",
+                      sorted(summary['by_prompt'].items(), key=lambda item: -item[1]['mean'])),
+        _format_table("Total score by model:",
+                      sorted(summary['by_model'].items(), key=lambda item: -item[1]['mean'])),
+        _format_table("Score by criterion (1-5):", summary['by_criterion'].items()),
+        _format_table("Total score by prompt x model:",
+                      [(f"{p} / {m}", stats) for (p, m), stats in
+                       sorted(summary['prompt_x_model'].items(), key=lambda item: -item[1]['mean'])]),
+    ]
+
+    criterion_lines = ["Mean criterion score by prompt:",
+                       "  " + f"{'prompt':<40}" + "".join(f"{name[:12]:>14}" for name in CRITERIA)]
+    for prompt_name in summary['by_prompt']:
+        criterion_lines.append("  " + f"{prompt_name:<40}" + "".join(
+            f"{summary['criterion_by_prompt'][name][prompt_name]['mean']:>14.2f}" for name in CRITERIA))
+    sections.append("\n".join(criterion_lines))
+    if summary['prescore_agreement']['n']:
+        sections.append(format_agreement(summary['prescore_agreement']))
+
+    return "\n\n".join(sections)
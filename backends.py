@@ -0,0 +1,395 @@
+#==============================================================================
+# MODEL BACKENDS
+# Builds the chat completion clients used by every stage, real or fake
+#==============================================================================
+
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+BACKEND_ENV = 'TODO_LLM_BACKEND'
+BACKENDS = ['openai', 'fake']
+
+_backend = {'name': os.getenv(BACKEND_ENV, 'openai'), 'options': {}}
+_clients = {}
+
+def configure_backend(name='openai', **options):
+    """Selects the backend for all later get_client()/get_async_client() calls."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}'. Choose from: {', '.join(BACKENDS)}")
+    _backend['name'] = name
+    _backend['options'] = options
+    _clients.clear()
+
+def backend_name():
+    return _backend['name']
+
+def _create_openai_client(use_async):
+    from dotenv import load_dotenv
+    from openai import OpenAI, AsyncOpenAI
+
+    load_dotenv()
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        raise ValueError("OpenAI API key not found. Ensure it's in the .env file.")
+    # The governor owns retries; SDK retries would bypass its buckets and telemetry
+    client_class = AsyncOpenAI if use_async else OpenAI
+    return client_class(api_key=api_key, max_retries=0)
+
+def _get(kind):
+    if kind not in _clients:
+        if _backend['name'] == 'fake':
+            llm = _clients.get('fake_llm') or FakeLLM(**_backend['options'])
+            _clients['fake_llm'] = llm
+            _clients[kind] = FakeAsyncClient(llm) if kind == 'async' else FakeClient(llm)
+        else:
+            _clients[kind] = _create_openai_client(kind == 'async')
+    return _clients[kind]
+
+def get_client():
+    """Returns the shared synchronous client, creating it on first use."""
+    return _get('sync')
+
+def get_async_client():
+    """Returns the shared asyncio client, creating it on first use."""
+    return _get('async')
+
+def get_fake_llm():
+    """Returns the FakeLLM behind the fake backend, or None when using OpenAI."""
+    if _backend['name'] != 'fake':
+        return None
+    get_client()
+    return _clients['fake_llm']
+
+#------------------------------------------------------------------------------
+# FAKE BACKEND
+#------------------------------------------------------------------------------
+
+class FakeAPIError(Exception):
+    """Raised by the fake backend for simulated server failures and rate limits.
+
+    Like the OpenAI SDK's errors it carries status_code and a response with
+    headers, so the governor treats both the same way.
+    """
+
+    def __init__(self, message, status_code=500, headers=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = SimpleNamespace(status_code=status_code, headers=headers or {})
+
+_TASK_WORDS = ["Review", "Draft", "Call", "Schedule", "Clean", "Organize", "Email", "Plan",
+               "Pay", "Renew", "Book", "Sort", "Update", "Prepare", "Check", "Return"]
+_OBJECT_WORDS = ["budget", "appointment", "inbox", "kitchen", "insurance", "report", "desk",
+                 "library books", "bank account", "calendar", "laundry", "groceries"]
+
+class FakeLLM:
+    """Deterministic local stand-in for the chat completions API.
+
+    Every response, latency and failure is derived from a hash of the request
+    and the seed, so repeated runs behave identically. Latencies follow a
+    log-normal distribution around latency_median seconds.
+
+    Provider prompt caching is simulated too: once a request with a given
+    (model, system prompt) completes, later requests sharing that prefix within
+    prefix_cache_ttl seconds report it as cached_tokens and run faster.
+
+    Requests with stream=True get their content in ~4-character chunks spaced
+    token_interval seconds apart after the initial latency, and max_tokens
+    truncates outputs with finish_reason 'length'. With a json_schema
+    response_format the reply is a JSON object filled in from the schema, and
+    chatty_rate makes that share of plain critic replies wrap their scores in
+    prose, as real models occasionally do.
+
+    Failures are drawn per attempt, so a retried request can succeed. With
+    rpm_limit/tpm_limit set, each model enforces a sliding one-minute window:
+    requests over the limit get a 429 with retry-after, and every response
+    carries x-ratelimit-* headers.
+    """
+
+    def __init__(self, seed=0, latency_median=0.05, latency_sigma=0.5, error_rate=0.0,
+                 response_items=8, time_scale=1.0, prefix_cache_ttl=300.0, prefix_cache_min_tokens=0,
+                 rpm_limit=None, tpm_limit=None, token_interval=0.001, chatty_rate=0.0):
+        self.seed = seed
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.response_items = response_items
+        self.time_scale = time_scale
+        self.prefix_cache_ttl = prefix_cache_ttl
+        self.prefix_cache_min_tokens = prefix_cache_min_tokens
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.token_interval = token_interval
+        self.chatty_rate = chatty_rate
+        self._warm_prefixes = {}
+        self._attempts = {}
+        self._windows = {}
+        self.call_latencies = []
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+
+    def _digest(self, model, messages, salt=''):
+        payload = json.dumps([self.seed, model, messages, salt], sort_keys=True)
+        return int(hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16], 16)
+
+    def _rng(self, model, messages, salt=''):
+        return random.Random(self._digest(model, messages, salt))
+
+    def _schema_reply(self, rng, schema):
+        reply = {}
+        for name, spec in schema.get('properties', {}).items():
+            if 'enum' in spec:
+                reply[name] = rng.choice(spec['enum'])
+            elif spec.get('type') == 'boolean':
+                reply[name] = rng.choice([True, False])
+            elif spec.get('type') == 'integer':
+                reply[name] = rng.randint(1, 5)
+            else:
+                reply[name] = "ok"
+        return json.dumps(reply)
+
+    def _content(self, rng, system_prompt, user_content, response_format=None):
+        if response_format and response_format.get('type') == 'json_schema':
+            return self._schema_reply(rng, response_format['json_schema']['schema'])
+        if "Rate each todo list" in system_prompt:
+            return "\n".join(
+                f"{list_id}: " + ",".join(str(rng.randint(1, 5)) for _ in range(5))
+                for list_id in re.findall(r'<<<LIST (\w+)>>>', user_content)
+            )
+        if "Rate this todo list" in system_prompt:
+            return ",".join(str(rng.randint(1, 5)) for _ in range(5))
+        if "to-do-list evaluation critic" in system_prompt:
+            kinds = ['score', 'bool', 'score', 'bool', 'bool', 'score', 'score']
+            return "\n".join(
+                f"{i}. {rng.randint(1, 5) if kind == 'score' else rng.choice(['true', 'false'])}"
+                for i, kind in enumerate(kinds, start=1)
+            )
+        if "analyzing the results" in system_prompt:
+            return "The leading prompt scores highest on average; differences between models are small."
+
+        items = max(1, int(rng.gauss(self.response_items, self.response_items / 4)))
+        lines = ["# Todo List", ""]
+        for i in range(items):
+            lines.append(f"- [ ] {rng.choice(_TASK_WORDS)} {rng.choice(_OBJECT_WORDS)} ({rng.choice([10, 15, 30, 45, 60])} min)")
+            if rng.random() < 0.3:
+                lines.append(f"  - {rng.choice(_TASK_WORDS)} {rng.choice(_OBJECT_WORDS)}")
+        return "\n".join(lines)
+
+    def plan(self, model, messages, n=1, max_tokens=None, response_format=None):
+        """Returns (latency_seconds, failed, contents, usage, finish_reasons) describing how a request will go."""
+        rng = self._rng(model, messages)
+        latency = rng.lognormvariate(0, self.latency_sigma) * self.latency_median * self.time_scale
+        request = self._digest(model, messages)
+        with self._lock:
+            attempt = self._attempts.get(request, 0)
+            self._attempts[request] = attempt + 1
+        failed = self._rng(model, messages, salt=f"attempt-{attempt}").random() < self.error_rate
+
+        system_prompt = next((m['content'] for m in messages if m['role'] == 'system'), '')
+        user_content = next((m['content'] for m in messages if m['role'] == 'user'), '')
+        contents = [
+            self._content(self._rng(model, messages, salt=str(i)), system_prompt, user_content, response_format)
+            for i in range(n)
+        ]
+        if (not response_format and "Rate this todo list" in system_prompt
+                and self._rng(model, messages, salt=f"chatty-{attempt}").random() < self.chatty_rate):
+            contents = [f"Sure! Here are my ratings: {content}. Let me know if you need anything else."
+                        for content in contents]
+        finish_reasons = ['stop'] * n
+        if max_tokens:
+            for i, content in enumerate(contents):
+                if len(content) // 4 + 1 > max_tokens:
+                    contents[i] = content[:max_tokens * 4]
+                    finish_reasons[i] = 'length'
+        prompt_tokens = sum(len(m['content']) for m in messages) // 4 + 1
+        completion_tokens = sum(len(c) for c in contents) // 4 + 1
+
+        cached_tokens = 0
+        prefix_tokens = len(system_prompt) // 4
+        warmed_at = self._warm_prefixes.get((model, system_prompt))
+        if (warmed_at is not None and time.monotonic() - warmed_at < self.prefix_cache_ttl
+                and prefix_tokens >= self.prefix_cache_min_tokens):
+            cached_tokens = prefix_tokens
+            latency *= 1 - 0.5 * cached_tokens / prompt_tokens
+
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens),
+        )
+        return latency, failed, contents, usage, finish_reasons
+
+    def warm(self, model, messages):
+        """Marks a request's system prompt as cached once the request has completed."""
+        system_prompt = next((m['content'] for m in messages if m['role'] == 'system'), '')
+        with self._lock:
+            self._warm_prefixes[(model, system_prompt)] = time.monotonic()
+
+    def admit(self, model, tokens):
+        """Applies the simulated rate limits. Returns x-ratelimit-* headers or raises a 429."""
+        if self.rpm_limit is None and self.tpm_limit is None:
+            return {}
+        rpm = self.rpm_limit or float('inf')
+        tpm = self.tpm_limit or float('inf')
+        with self._lock:
+            now = time.monotonic()
+            window = [(at, used) for at, used in self._windows.get(model, []) if now - at < 60]
+            self._windows[model] = window
+            used_tokens = sum(used for _, used in window)
+            if len(window) + 1 > rpm or used_tokens + tokens > tpm:
+                self.rate_limited += 1
+                retry_after = 60 - (now - window[0][0]) if window else 1.0
+                raise FakeAPIError("Simulated rate limit exceeded", status_code=429,
+                                   headers={'retry-after': f"{retry_after:.3f}"})
+            window.append((now, tokens))
+            headers = {}
+            if self.rpm_limit is not None:
+                headers['x-ratelimit-limit-requests'] = str(self.rpm_limit)
+                headers['x-ratelimit-remaining-requests'] = str(self.rpm_limit - len(window))
+                headers['x-ratelimit-reset-requests'] = f"{60 - (now - window[0][0]):.3f}s"
+            if self.tpm_limit is not None:
+                headers['x-ratelimit-limit-tokens'] = str(self.tpm_limit)
+                headers['x-ratelimit-remaining-tokens'] = str(self.tpm_limit - used_tokens - tokens)
+                headers['x-ratelimit-reset-tokens'] = f"{60 - (now - window[0][0]):.3f}s"
+            return headers
+
+    def record(self, elapsed, failed):
+        with self._lock:
+            self.calls += 1
+            self.call_latencies.append(elapsed)
+            if failed:
+                self.errors += 1
+
+    def reset_stats(self):
+        with self._lock:
+            self.call_latencies = []
+            self.calls = 0
+            self.errors = 0
+            self.rate_limited = 0
+
+    def respond_body(self, body):
+        """Answers one batch request body immediately; used with batch.LocalBatchTransport."""
+        _, failed, contents, _, _ = self.plan(body['model'], body['messages'], max_tokens=body.get('max_tokens'),
+                                              response_format=body.get('response_format'))
+        if failed:
+            raise FakeAPIError("Simulated server error")
+        return contents[0]
+
+def _completion(model, contents, usage, finish_reasons):
+    return SimpleNamespace(
+        id='fake-completion',
+        model=model,
+        choices=[
+            SimpleNamespace(index=i, finish_reason=finish_reason,
+                            message=SimpleNamespace(role='assistant', content=content))
+            for i, (content, finish_reason) in enumerate(zip(contents, finish_reasons))
+        ],
+        usage=usage,
+    )
+
+def _chunks(model, contents, usage, finish_reasons, include_usage):
+    """Splits a planned completion into streaming chunks, interleaving the choices."""
+    def chunk(choices, usage=None):
+        return SimpleNamespace(id='fake-completion', model=model, choices=choices, usage=usage)
+
+    pieces = [[content[i:i + 4] for i in range(0, len(content), 4)] for content in contents]
+    for position in range(max((len(p) for p in pieces), default=0)):
+        yield chunk([
+            SimpleNamespace(index=i, delta=SimpleNamespace(content=p[position]), finish_reason=None)
+            for i, p in enumerate(pieces) if position < len(p)
+        ])
+    yield chunk([
+        SimpleNamespace(index=i, delta=SimpleNamespace(content=None), finish_reason=finish_reason)
+        for i, finish_reason in enumerate(finish_reasons)
+    ])
+    if include_usage:
+        yield chunk([], usage)
+
+class _FakeStream:
+    def __init__(self, llm, chunks):
+        self.llm = llm
+        self.chunks = chunks
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                time.sleep(self.llm.token_interval * self.llm.time_scale)
+            yield chunk
+
+    def __aiter__(self):
+        return self._aiter()
+
+    async def _aiter(self):
+        import asyncio
+        for chunk in self.chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                await asyncio.sleep(self.llm.token_interval * self.llm.time_scale)
+            yield chunk
+
+    def close(self):
+        self.chunks = iter(())
+
+class _FakeCompletions:
+    def __init__(self, llm):
+        self.llm = llm
+        self.with_raw_response = SimpleNamespace(create=self._create_raw)
+
+    def _start(self, model, messages, n, max_tokens, response_format):
+        plan = self.llm.plan(model, messages, n, max_tokens, response_format)
+        headers = self.llm.admit(model, plan[3].total_tokens)
+        return plan, headers
+
+    def _finish(self, model, messages, start, plan, headers, stream, stream_options):
+        _, failed, contents, usage, finish_reasons = plan
+        self.llm.record(time.perf_counter() - start, failed)
+        if failed:
+            raise FakeAPIError("Simulated server error")
+        self.llm.warm(model, messages)
+        if stream:
+            include_usage = bool((stream_options or {}).get('include_usage'))
+            response = _FakeStream(self.llm, _chunks(model, contents, usage, finish_reasons, include_usage))
+        else:
+            response = _completion(model, contents, usage, finish_reasons)
+        return SimpleNamespace(headers=headers, parse=lambda: response)
+
+    def _create_raw(self, model, messages, n=1, max_tokens=None, stream=False, stream_options=None,
+                    response_format=None, **kwargs):
+        start = time.perf_counter()
+        plan, headers = self._start(model, messages, n, max_tokens, response_format)
+        time.sleep(plan[0])
+        return self._finish(model, messages, start, plan, headers, stream, stream_options)
+
+    def create(self, model, messages, **kwargs):
+        return self._create_raw(model, messages, **kwargs).parse()
+
+class _FakeAsyncCompletions(_FakeCompletions):
+    async def _create_raw(self, model, messages, n=1, max_tokens=None, stream=False, stream_options=None,
+                          response_format=None, **kwargs):
+        import asyncio
+        start = time.perf_counter()
+        plan, headers = self._start(model, messages, n, max_tokens, response_format)
+        await asyncio.sleep(plan[0])
+        return self._finish(model, messages, start, plan, headers, stream, stream_options)
+
+    async def create(self, model, messages, **kwargs):
+        return (await self._create_raw(model, messages, **kwargs)).parse()
+
+class FakeClient:
+    """Mimics OpenAI().chat.completions.create on top of a FakeLLM."""
+
+    def __init__(self, llm):
+        self.chat = SimpleNamespace(completions=_FakeCompletions(llm))
+
+class FakeAsyncClient:
+    """Mimics AsyncOpenAI().chat.completions.create on top of a FakeLLM."""
+
+    def __init__(self, llm):
+        self.chat = SimpleNamespace(completions=_FakeAsyncCompletions(llm))
@@ -0,0 +1,172 @@
+#==============================================================================
+# BATCH SUBMISSION
+# Submits chat completion requests as JSONL batches and collects the results
+#==============================================================================
+
+import datetime
+import io
+import json
+import os
+import time
+
+BATCH_DIR = 'batches'
+BATCH_ENDPOINT = '/v1/chat/completions'
+COMPLETION_WINDOW = '24h'
+MAX_REQUESTS_PER_BATCH = 50000
+DEFAULT_POLL_INTERVAL = 30
+TERMINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+
+def build_request(custom_id, model, messages, **params):
+    """Builds one line of a batch input file."""
+    body = {'model': model, 'messages': messages}
+    body.update(params)
+    return {
+        'custom_id': custom_id,
+        'method': 'POST',
+        'url': BATCH_ENDPOINT,
+        'body': body,
+    }
+
+def parse_output_line(line):
+    """Returns (custom_id, content) for one line of a batch output file; content is None on failure."""
+    record = json.loads(line)
+    response = record.get('response') or {}
+    if record.get('error') or response.get('status_code') != 200:
+        return record['custom_id'], None
+    return record['custom_id'], response['body']['choices'][0]['message']['content']
+
+#------------------------------------------------------------------------------
+# TRANSPORTS
+#------------------------------------------------------------------------------
+
+class OpenAIBatchTransport:
+    """Talks to the OpenAI Files and Batches APIs."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def upload(self, path):
+        with open(path, 'rb') as f:
+            return self.client.files.create(file=f, purpose='batch').id
+
+    def create(self, input_file_id):
+        batch = self.client.batches.create(
+            input_file_id=input_file_id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=COMPLETION_WINDOW
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        """Returns (status, output_file_id) for a submitted batch."""
+        batch = self.client.batches.retrieve(batch_id)
+        return batch.status, batch.output_file_id
+
+    def download(self, file_id):
+        return self.client.files.content(file_id).text
+
+class LocalBatchTransport:
+    """In-process stand-in for the batch API that answers each request with responder(body).
+
+    Useful for exercising the batch path without a network. Batches report
+    'in_progress' for the first polls_until_complete polls, then 'completed'.
+    """
+
+    def __init__(self, responder, polls_until_complete=1):
+        self.responder = responder
+        self.polls_until_complete = polls_until_complete
+        self.files = {}
+        self.batches = {}
+
+    def _new_id(self, prefix):
+        return f"{prefix}-{len(self.files) + len(self.batches) + 1}"
+
+    def upload(self, path):
+        file_id = self._new_id('file')
+        with open(path, 'r', encoding='utf-8') as f:
+            self.files[file_id] = f.read()
+        return file_id
+
+    def create(self, input_file_id):
+        batch_id = self._new_id('batch')
+        self.batches[batch_id] = {'input': input_file_id, 'polls': 0, 'output': None}
+        return batch_id
+
+    def status(self, batch_id):
+        batch = self.batches[batch_id]
+        batch['polls'] += 1
+        if batch['polls'] <= self.polls_until_complete:
+            return 'in_progress', None
+        if batch['output'] is None:
+            batch['output'] = self._run(batch['input'])
+        return 'completed', batch['output']
+
+    def _run(self, input_file_id):
+        output = io.StringIO()
+        for line in self.files[input_file_id].splitlines():
+            request = json.loads(line)
+            try:
+                content = self.responder(request['body'])
+                record = {
+                    'custom_id': request['custom_id'],
+                    'response': {
+                        'status_code': 200,
+                        'body': {'choices': [{'message': {'role': 'assistant', 'content': content}}]},
+                    },
+                    'error': None,
+                }
+            except Exception as e:
+                record = {'custom_id': request['custom_id'], 'response': None, 'error': {'message': str(e)}}
+            output.write(json.dumps(record) + '\n')
+        file_id = self._new_id('file')
+        self.files[file_id] = output.getvalue()
+        return file_id
+
+    def download(self, file_id):
+        return self.files[file_id]
+
+#------------------------------------------------------------------------------
+# SUBMISSION
+#------------------------------------------------------------------------------
+
+def submit_batch(transport, requests, name, poll_interval=DEFAULT_POLL_INTERVAL):
+    """Uploads requests as one or more batches, waits for them, and returns {custom_id: content}."""
+    if not requests:
+        return {}
+
+    os.makedirs(BATCH_DIR, exist_ok=True)
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+
+    batch_ids = []
+    for start in range(0, len(requests), MAX_REQUESTS_PER_BATCH):
+        chunk = requests[start:start + MAX_REQUESTS_PER_BATCH]
+        path = os.path.join(BATCH_DIR, f"{name}_{timestamp}_{start // MAX_REQUESTS_PER_BATCH:03d}.jsonl")
+        with open(path, 'w', encoding='utf-8') as f:
+            for request in chunk:
+                f.write(json.dumps(request) + '\n')
+        batch_ids.append(transport.create(transport.upload(path)))
+        print(f"Submitted batch {batch_ids[-1]} with {len(chunk)} requests ({path})")
+
+    results = {}
+    pending = list(batch_ids)
+    while pending:
+        still_pending = []
+        for batch_id in pending:
+            status, output_file_id = transport.status(batch_id)
+            if status not in TERMINAL_STATUSES:
+                still_pending.append(batch_id)
+                continue
+            print(f"Batch {batch_id} finished with status '{status}'")
+            if output_file_id:
+                for line in transport.download(output_file_id).splitlines():
+                    if line.strip():
+                        custom_id, content = parse_output_line(line)
+                        results[custom_id] = content
+        pending = still_pending
+        if pending:
+            time.sleep(poll_interval)
+
+    failed = sum(1 for request in requests if results.get(request['custom_id']) is None)
+    if failed:
+        print(f"{failed} of {len(requests)} batch requests returned no result")
+    return results
@@ -0,0 +1,154 @@
+#==============================================================================
+# PIPELINE BENCHMARK
+# Measures generate -> evaluate -> analyze throughput on the fake backend
+#==============================================================================
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+# Progress bars would dominate the output of a 50k-cell run
+os.environ.setdefault('TQDM_DISABLE', '1')
+
+import main
+from backends import configure_backend, get_fake_llm
+from cache import configure_cache
+from governor import configure_governor
+from ledger import close_ledger
+from output_store import close_output_store
+from telemetry import telemetry, percentile
+
+DEFAULT_SIZES = [10, 1000, 50000]
+
+def grid_shape(size, model_count):
+    """Picks a roughly square prompts x tasks grid giving at least `size` cells."""
+    prompt_count = max(1, round(math.sqrt(size / model_count)))
+    task_count = max(1, math.ceil(size / (model_count * prompt_count)))
+    return prompt_count, task_count
+
+def write_synthetic_inputs(root, prompt_count, task_count):
+    """Writes synthetic prompts/*.md and tasks/*.md files into root."""
+    os.makedirs(os.path.join(root, 'prompts'))
+    os.makedirs(os.path.join(root, 'tasks'))
+    for i in range(prompt_count):
+        with open(os.path.join(root, 'prompts', f"style-{i:04d}.md"), 'w') as f:
+            f.write(f"You are todo list generator #{i}. Create clear, actionable todo lists. " * (1 + i % 5))
+    for i in range(task_count):
+        with open(os.path.join(root, 'tasks', f"Task {i:05d}.md"), 'w') as f:
+            f.write("\n".join(f"Errand {i}-{j}" for j in range(5 + i % 20)))
+
+def run_stage(name, fn, llm):
+    """Runs one pipeline stage and measures wall time, call latency and peak memory."""
+    llm.reset_stats()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        fn()
+    seconds = time.perf_counter() - start
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    return {
+        'stage': name,
+        'seconds': seconds,
+        'calls': llm.calls,
+        'errors': llm.errors,
+        'rate_limited': llm.rate_limited,
+        'throughput': llm.calls / seconds if seconds else 0.0,
+        'p50_ms': percentile(llm.call_latencies, 50) * 1000,
+        'p99_ms': percentile(llm.call_latencies, 99) * 1000,
+        'peak_mb': peak_bytes / (1024 * 1024),
+    }
+
+def run_benchmark(size, concurrency, fake_options, use_cache=False, streaming=False):
+    """Runs the full pipeline on a synthetic grid of roughly `size` cells in a scratch directory."""
+    prompt_count, task_count = grid_shape(size, len(main.MODELS))
+    scratch = tempfile.mkdtemp(prefix=f"todo_bench_{size}_")
+    original_dir = os.getcwd()
+
+    configure_backend('fake', **fake_options)
+    configure_cache(enabled=use_cache)
+    configure_governor(assume_limits=False)
+    llm = get_fake_llm()
+
+    results = []
+    try:
+        write_synthetic_inputs(scratch, prompt_count, task_count)
+        os.chdir(scratch)
+        close_ledger()
+        close_output_store()
+        telemetry.reset()
+        os.makedirs('output')
+
+        tracemalloc.start()
+        if streaming:
+            results.append(run_stage('run', lambda: main.run_pipeline(concurrency), llm))
+        else:
+            results.append(run_stage('generate', lambda: main.run_generation(concurrency), llm))
+            results.append(run_stage('evaluate', main.run_critic, llm))
+        results.append(run_stage('analyze', main.analyze_results, llm))
+        tracemalloc.stop()
+    finally:
+        close_ledger()
+        close_output_store()
+        telemetry.reset()
+        os.chdir(original_dir)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    cells = prompt_count * task_count * len(main.MODELS)
+    for result in results:
+        result['cells'] = cells
+    return results
+
+def format_results(results):
+    lines = [f"{'cells':>7} {'stage':<9} {'seconds':>9} {'calls':>7} {'calls/s':>9} "
+             f"{'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'429s':>6} {'peak MB':>8}"]
+    for r in results:
+        lines.append(
+            f"{r['cells']:>7} {r['stage']:<9} {r['seconds']:>9.2f} {r['calls']:>7} {r['throughput']:>9.1f} "
+            f"{r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['errors']:>7} {r['rate_limited']:>6} {r['peak_mb']:>8.1f}"
+        )
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the generate -> evaluate -> analyze pipeline offline')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Approximate grid sizes (cells) to run')
+    parser.add_argument('--concurrency', type=int, default=main.DEFAULT_CONCURRENCY, help='Generation concurrency')
+    parser.add_argument('--latency', type=float, default=0.01, help='Median simulated call latency in seconds')
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help='Log-normal sigma of simulated latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of simulated calls that fail')
+    parser.add_argument('--response-items', type=int, default=8, help='Average number of items in a generated todo list')
+    parser.add_argument('--rpm-limit', type=int, help='Simulated requests-per-minute limit per model (default: none)')
+    parser.add_argument('--tpm-limit', type=int, help='Simulated tokens-per-minute limit per model (default: none)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the fake backend')
+    parser.add_argument('--cache', action='store_true', help='Leave the response cache enabled (disabled by default)')
+    parser.add_argument('--streaming', action='store_true', help='Use the streaming "run" pipeline instead of separate generate and evaluate stages')
+    parser.add_argument('--json', help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    fake_options = {
+        'seed': args.seed,
+        'latency_median': args.latency,
+        'latency_sigma': args.latency_sigma,
+        'error_rate': args.error_rate,
+        'response_items': args.response_items,
+        'rpm_limit': args.rpm_limit,
+        'tpm_limit': args.tpm_limit,
+    }
+
+    all_results = []
+    for size in args.sizes:
+        print(f"Benchmarking ~{size} cells...")
+        size_results = run_benchmark(size, args.concurrency, fake_options, args.cache, args.streaming)
+        all_results.extend(size_results)
+        print(format_results(size_results))
+
+    print("\nSummary:")
+    print(format_results(all_results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(all_results, f, indent=2)
@@ -0,0 +1,120 @@
+#==============================================================================
+# RESPONSE CACHE
+# Content-addressed on-disk cache for model responses
+#==============================================================================
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+CACHE_DIR = os.path.join('.cache', 'responses')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_AGE_DAYS = 30
+
+class ResponseCache:
+    """Stores model responses on disk, keyed by a hash of everything that shaped them."""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 24 * 60 * 60
+        self.enabled = True
+        self.refresh = False
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, model, system_prompt, user_content, **params):
+        """Hashes (model, system prompt, user content, parameters) into a cache key."""
+        payload = json.dumps({
+            'model': model,
+            'system': system_prompt,
+            'user': user_content,
+            'params': params,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Returns the cached response for key, or None on a miss."""
+        if not self.enabled or self.refresh:
+            self.misses += 1
+            return None
+
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                self.misses += 1
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                response = json.load(f)['response']
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+
+        # Touch the entry so eviction drops the least recently used files first
+        os.utime(path)
+        self.hits += 1
+        return response
+
+    def put(self, key, response):
+        """Stores a response. Empty responses are never cached."""
+        if not self.enabled or not response:
+            return
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique per thread as well as per process: worker threads may store the same key at once
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'response': response}, f)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """Removes expired entries, then the oldest entries until under the size limit."""
+        if not os.path.exists(self.cache_dir):
+            return 0
+
+        now = time.time()
+        entries = []
+        removed = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if now - stat.st_mtime > self.max_age:
+                    os.remove(path)
+                    removed += 1
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            os.remove(path)
+            total_bytes -= size
+            removed += 1
+        return removed
+
+    def summary(self):
+        """One-line hit/miss report for the end of a run."""
+        lookups = self.hits + self.misses
+        if not self.enabled:
+            return "Response cache disabled."
+        hit_rate = (self.hits / lookups * 100) if lookups else 0.0
+        return f"Response cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate)"
+
+response_cache = ResponseCache()
+
+def configure_cache(enabled=True, refresh=False):
+    """Applies the --no-cache / --refresh command line switches."""
+    response_cache.enabled = enabled
+    response_cache.refresh = refresh
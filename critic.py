@@ -3,12 +3,14 @@
 # Evaluates generated todo lists using defined criteria
 #==============================================================================
 
-from openai import OpenAI
-import os
+import json
+import re
+from cache import response_cache
+from telemetry import telemetry
+from governor import governor
 
-def evaluate_todo(client, todo_output):
-    """Evaluates a todo list output using GPT-4 as a critic."""
-    critic_prompt = """Rate this todo list from 1-5 on each criteria:
+CRITIC_MODEL = "gpt-4"
+CRITIC_PROMPT = """Rate this todo list from 1-5 on each criteria:
 1. Task clarity: Are items clearly defined?
 2. Actionability: Can tasks be acted on immediately?
 3. Priority clarity: Is importance/urgency clear?
@@ -17,52 +19,257 @@ def evaluate_todo(client, todo_output):
 
 Return only numbers separated by commas (e.g. 4,3,5,4,2)"""
 
+PACKED_CRITIC_PROMPT = """You will receive several todo lists. Each one starts with a line <<<LIST id>>> and ends with a line <<<END id>>>.
+Rate each todo list from 1-5 on each criteria:
+1. Task clarity: Are items clearly defined?
+2. Actionability: Can tasks be acted on immediately?
+3. Priority clarity: Is importance/urgency clear?
+4. Timeframes: Are deadlines reasonable?
+5. Task breakdown: Are complex items properly subdivided?
+
+Return exactly one line per list, in the form id: numbers separated by commas (e.g. L1: 4,3,5,4,2). Return nothing else."""
+
+PACKED_ROW = re.compile(r'^\s*(L\d+)\s*:\s*([0-9,\s]+?)\s*$')
+
+# Constrained mode: the reply must match a JSON schema and is capped at a few tokens
+CONSTRAINED_CRITIC_PROMPT = """Rate this todo list from 1-5 on each criterion:
+clarity: Are items clearly defined?
+actionability: Can tasks be acted on immediately?
+priority: Is importance/urgency clear?
+timeframes: Are deadlines reasonable?
+breakdown: Are complex items properly subdivided?"""
+CRITERIA_KEYS = ['clarity', 'actionability', 'priority', 'timeframes', 'breakdown']
+CRITIC_RESPONSE_FORMAT = {
+    'type': 'json_schema',
+    'json_schema': {
+        'name': 'todo_list_scores',
+        'strict': True,
+        'schema': {
+            'type': 'object',
+            'properties': {key: {'type': 'integer', 'enum': [1, 2, 3, 4, 5]} for key in CRITERIA_KEYS},
+            'required': CRITERIA_KEYS,
+            'additionalProperties': False,
+        },
+    },
+}
+CONSTRAINED_MAX_TOKENS = 60
+# json_schema response formats need a model with structured outputs; gpt-4 itself rejects them
+CONSTRAINED_CRITIC_MODEL = "gpt-4o-mini"
+NO_STRUCTURED_OUTPUT = ('gpt-4', 'gpt-4-turbo', 'gpt-3.5-turbo')
+MAX_CRITIC_ATTEMPTS = 2
+
+_critic = {'model': CRITIC_MODEL, 'constrained': False}
+
+def supports_structured_output(model):
+    """False for the older chat models that answer a json_schema response format with a 400."""
+    return model not in NO_STRUCTURED_OUTPUT and not model.startswith(('gpt-4-', 'gpt-3.5-'))
+
+def configure_critic(model=None, constrained=False):
+    """Applies the --critic-model / --constrained-critic switches; the default model depends on the mode."""
+    _critic['model'] = model or (CONSTRAINED_CRITIC_MODEL if constrained else CRITIC_MODEL)
+    _critic['constrained'] = constrained
+
+def critic_model():
+    return _critic['model']
+
+def critic_constrained():
+    return _critic['constrained']
+
+def critic_request():
+    """Returns (system prompt, extra create() parameters) for the configured critic mode."""
+    if _critic['constrained']:
+        return CONSTRAINED_CRITIC_PROMPT, {
+            'response_format': CRITIC_RESPONSE_FORMAT,
+            'max_tokens': CONSTRAINED_MAX_TOKENS,
+            'temperature': 0,
+        }
+    return CRITIC_PROMPT, {}
+
+def parse_score_string(scores):
+    """Returns the five 1-5 scores in a critic reply, or None if it is malformed."""
     try:
-        completion = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": critic_prompt},
-                {"role": "user", "content": todo_output}
-            ]
-        )
-        return completion.choices[0].message.content
-    except Exception as e:
-        print(f"Critic error: {e}")
+        values = [int(x) for x in scores.strip().split(',')]
+    except (AttributeError, ValueError):
+        return None
+    if len(values) != 5 or not all(1 <= v <= 5 for v in values):
         return None
+    return values
+
+def parse_critic_reply(content):
+    """Validates a critic reply in the configured mode and returns it as a canonical score string, or None."""
+    if _critic['constrained']:
+        try:
+            data = json.loads(content)
+            values = [data[key] for key in CRITERIA_KEYS]
+        except (TypeError, ValueError, KeyError):
+            return None
+        if not all(type(v) is int for v in values):
+            return None
+        content = ",".join(str(v) for v in values)
+    values = parse_score_string(content)
+    if values is None:
+        return None
+    return ",".join(str(v) for v in values)
+
+def evaluate_todo(client, todo_output):
+    """Evaluates a todo list output with the critic model; returns a validated score string or None.
+
+    A reply that does not validate is retried (up to MAX_CRITIC_ATTEMPTS
+    calls in total) rather than handed back to the caller to fail on.
+    """
+    model = critic_model()
+    system_prompt, params = critic_request()
+    cache_key = response_cache.make_key(model, system_prompt, todo_output, **params)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    for _ in range(MAX_CRITIC_ATTEMPTS):
+        try:
+            with telemetry.track('evaluate', model) as call:
+                completion = governor.create(client, call,
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": todo_output}
+                    ],
+                    **params
+                )
+                call.usage(completion.usage)
+                scores = parse_critic_reply(completion.choices[0].message.content)
+                if scores is None:
+                    call['error'] = 'InvalidReply'
+        except Exception as e:
+            print(f"Critic error: {e}")
+            return None
+        if scores is not None:
+            response_cache.put(cache_key, scores)
+            return scores
+    print(f"Critic error: no valid scores after {MAX_CRITIC_ATTEMPTS} attempts")
+    return None
+
+async def evaluate_todo_async(client, todo_output):
+    """Async counterpart of evaluate_todo() for the streaming pipeline."""
+    model = critic_model()
+    system_prompt, params = critic_request()
+    cache_key = response_cache.make_key(model, system_prompt, todo_output, **params)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    for _ in range(MAX_CRITIC_ATTEMPTS):
+        try:
+            with telemetry.track('evaluate', model) as call:
+                completion = await governor.create_async(client, call,
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": todo_output}
+                    ],
+                    **params
+                )
+                call.usage(completion.usage)
+                scores = parse_critic_reply(completion.choices[0].message.content)
+                if scores is None:
+                    call['error'] = 'InvalidReply'
+        except Exception as e:
+            print(f"Critic error: {e}")
+            return None
+        if scores is not None:
+            response_cache.put(cache_key, scores)
+            return scores
+    print(f"Critic error: no valid scores after {MAX_CRITIC_ATTEMPTS} attempts")
+    return None
+
+def evaluate_todo_packed(client, todo_outputs):
+    """Evaluates several todo lists in a single critic request.
+
+    todo_outputs maps caller IDs to todo list text; the result maps the same IDs
+    to score strings. Lists whose row is missing or malformed in the packed
+    reply fall back to a single evaluate_todo() call. Packing always uses the
+    plain text format; the constrained mode applies to those fallbacks.
+    """
+    model = critic_model()
+    results = {}
+    pending = {}
+    for key, todo_output in todo_outputs.items():
+        cached = response_cache.get(response_cache.make_key(model, PACKED_CRITIC_PROMPT, todo_output))
+        if cached is not None:
+            results[key] = cached
+        else:
+            pending[f"L{len(pending) + 1}"] = key
+
+    if len(pending) == 1:
+        (key,) = pending.values()
+        results[key] = evaluate_todo(client, todo_outputs[key])
+        return results
+
+    rows = {}
+    if pending:
+        packed = "\n\n".join(
+            f"<<<LIST {list_id}>>>\n{todo_outputs[key]}\n<<<END {list_id}>>>" for list_id, key in pending.items()
+        )
+        try:
+            with telemetry.track('evaluate', model) as call:
+                completion = governor.create(client, call,
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": PACKED_CRITIC_PROMPT},
+                        {"role": "user", "content": packed}
+                    ]
+                )
+                call.usage(completion.usage)
+            for line in completion.choices[0].message.content.splitlines():
+                match = PACKED_ROW.match(line)
+                if match:
+                    rows[match.group(1)] = match.group(2).replace(' ', '')
+        except Exception as e:
+            print(f"Packed critic error: {e}")
+
+    for list_id, key in pending.items():
+        scores = rows.get(list_id)
+        if parse_score_string(scores) is None:
+            results[key] = evaluate_todo(client, todo_outputs[key])
+            continue
+        response_cache.put(response_cache.make_key(model, PACKED_CRITIC_PROMPT, todo_outputs[key]), scores)
+        results[key] = scores
+    return results
 
 #==============================================================================
 # ANALYSIS FUNCTION
 # Evaluates which prompt/model combo is best
 #==============================================================================
 
-def analyze_scores(client, csv_content):
-    """Analyzes the scores.csv to determine the most effective prompt and model combinations."""
-    analysis_prompt = """You are analyzing the results of different todo list prompts and models. The data shows scores for different combinations, where each row contains:
-    - Prompt: The prompt style used
-    - Output File: Contains the model name used (e.g., gpt-4o-mini)
-    - Score String: Five comma-separated scores (1-5) for:
+def analyze_scores(client, summary_text):
+    """Interprets the aggregated score summary to determine the most effective prompt and model combinations."""
+    analysis_prompt = """You are analyzing the results of different todo list prompts and models. The data is a summary of every scored todo list, already aggregated into tables of sample size (n), mean, variance and 95% confidence interval:
+    - Total score by prompt style and by model (total is the sum of five 1-5 scores, max 25)
+    - Score by criterion, for:
         1. Task clarity
         2. Actionability
         3. Priority clarity
         4. Timeframes
         5. Task breakdown
-    - Total Score: Sum of the individual scores
+    - Total score for each prompt x model combination
+    - Mean criterion score for each prompt
 
     Analyze this data and tell me:
     1. Which prompt consistently produces the best results?
     2. Are there any notable patterns in what makes certain prompts more effective?
     3. How do different models perform with these prompts?
 
-    Keep your analysis focused and data-driven."""
+    Keep your analysis focused and data-driven, and treat differences whose confidence intervals overlap heavily as inconclusive."""
 
     try:
-        completion = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": analysis_prompt},
-                {"role": "user", "content": csv_content}
-            ]
-        )
+        with telemetry.track('analyze', "gpt-4") as call:
+            completion = governor.create(client, call,
+                model="gpt-4",
+                messages=[
+                    {"role": "system", "content": analysis_prompt},
+                    {"role": "user", "content": summary_text}
+                ]
+            )
+            call.usage(completion.usage)
         return completion.choices[0].message.content
     except Exception as e:
         print(f"Analysis error: {e}")
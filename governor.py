@@ -0,0 +1,287 @@
+#==============================================================================
+# RATE-LIMIT GOVERNOR
+# Per-model request/token buckets and retries shared by every model call
+#==============================================================================
+
+import random
+import re
+import threading
+import time
+
+# Requests and tokens per minute assumed until the provider's rate-limit headers say otherwise
+MODEL_LIMITS = {
+    'gpt-4': (500, 10_000),
+    'gpt-4o': (500, 30_000),
+    'gpt-4o-mini': (500, 200_000),
+    'gpt-3.5-turbo': (500, 200_000),
+}
+DEFAULT_LIMITS = (500, 30_000)
+DEFAULT_COMPLETION_TOKENS = 500
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+
+RETRYABLE_STATUS = {408, 409, 429}
+RETRYABLE_ERRORS = {'APIConnectionError', 'APITimeoutError'}
+DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+def estimate_prompt_tokens(messages):
+    """Rough token count of the prompt messages: ~4 characters per token plus per-message overhead."""
+    return sum(len(m['content']) // 4 + 4 for m in messages) + 3
+
+def estimate_tokens(messages, max_tokens=None, n=1):
+    """Rough token count of a request: the prompt plus the expected completion(s)."""
+    return estimate_prompt_tokens(messages) + (max_tokens or DEFAULT_COMPLETION_TOKENS) * n
+
+def parse_duration(value):
+    """Seconds in a rate-limit reset header such as '1s', '6m0s' or '20ms'; None if unparseable."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+def _header(headers, name):
+    try:
+        return headers.get(name) if headers is not None else None
+    except AttributeError:
+        return None
+
+def _status(error):
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status
+
+def is_retryable(error):
+    """Rate limits, timeouts, conflicts, server errors and dropped connections are worth retrying."""
+    status = _status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+def retry_delay(error, attempt):
+    """Seconds to wait before retry `attempt`: the server's retry-after if given, else full-jitter backoff."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    retry_after_ms = _header(headers, 'retry-after-ms')
+    if retry_after_ms is not None:
+        return float(retry_after_ms) / 1000 + random.uniform(0, 0.1)
+    retry_after = parse_duration(_header(headers, 'retry-after'))
+    if retry_after is not None:
+        return retry_after + random.uniform(0, 0.1 * max(retry_after, 1))
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+class TokenBucket:
+    """A bucket holding up to `capacity` units that refills at capacity per minute.
+
+    reserve() debits immediately (the level may go negative) and returns how
+    long the caller must wait, so concurrent callers queue up fairly without
+    polling. A capacity of None means no limit is known yet.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = float(capacity) if capacity else None
+        self.level = self.capacity
+        self.blocked_until = 0.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.capacity is not None:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        self._refill(now)
+        wait = 0.0
+        if self.capacity is not None:
+            self.level -= min(amount, self.capacity)
+            wait = -self.level * 60 / self.capacity if self.level < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def refund(self, amount, now):
+        self._refill(now)
+        if self.capacity is not None:
+            self.level = min(self.capacity, self.level + amount)
+
+    def observe(self, limit, remaining, reset, now):
+        """Adopts the provider's view: its limit as capacity and at most `remaining` units available."""
+        self._refill(now)
+        if limit:
+            if self.capacity is None:
+                self.level = float(limit)
+            self.capacity = float(limit)
+        if remaining is not None and self.capacity is not None:
+            self.level = min(self.level, float(remaining))
+        if remaining == 0 and reset:
+            self.blocked_until = max(self.blocked_until, now + reset)
+
+class ModelGovernor:
+    """Request and token buckets for one model, shared by every thread and coroutine in the process."""
+
+    def __init__(self, model, rpm, tpm):
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens):
+        """Reserves one request and `tokens` tokens; returns the seconds to wait before sending."""
+        with self._lock:
+            now = time.monotonic()
+            return max(self.requests.reserve(1, now), self.tokens.reserve(tokens, now))
+
+    def settle(self, estimated, actual):
+        """Corrects a reservation once the real token usage is known."""
+        if actual is None:
+            return
+        with self._lock:
+            self.tokens.refund(estimated - actual, time.monotonic())
+
+    def observe(self, headers):
+        """Adapts the buckets to x-ratelimit-* response headers."""
+        if not headers:
+            return
+        def number(name):
+            value = _header(headers, name)
+            try:
+                return int(value) if value is not None else None
+            except ValueError:
+                return None
+        with self._lock:
+            now = time.monotonic()
+            self.requests.observe(number('x-ratelimit-limit-requests'), number('x-ratelimit-remaining-requests'),
+                                  parse_duration(_header(headers, 'x-ratelimit-reset-requests')), now)
+            self.tokens.observe(number('x-ratelimit-limit-tokens'), number('x-ratelimit-remaining-tokens'),
+                                parse_duration(_header(headers, 'x-ratelimit-reset-tokens')), now)
+
+    def back_off(self, seconds):
+        """Holds every caller of this model for `seconds` after a rate-limit response."""
+        with self._lock:
+            until = time.monotonic() + seconds
+            self.requests.blocked_until = max(self.requests.blocked_until, until)
+
+class Governor:
+    """Hands out one ModelGovernor per model and runs calls through it with retries.
+
+    With assume_limits=False (e.g. for the fake backend) models start
+    unthrottled and only adopt limits announced by rate-limit headers.
+    """
+
+    def __init__(self, limits=None, max_retries=DEFAULT_MAX_RETRIES, assume_limits=True):
+        self.limits = dict(MODEL_LIMITS, **(limits or {}))
+        self.max_retries = max_retries
+        self.assume_limits = assume_limits
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def for_model(self, model):
+        with self._lock:
+            if model not in self._models:
+                rpm, tpm = self.limits.get(model, DEFAULT_LIMITS) if self.assume_limits else (None, None)
+                self._models[model] = ModelGovernor(model, rpm, tpm)
+            return self._models[model]
+
+    def _send(self, completions, kwargs):
+        """Calls create(), reading the rate-limit headers when the client exposes them."""
+        raw_api = getattr(completions, 'with_raw_response', None)
+        if raw_api is None:
+            return completions.create(**kwargs), None
+        raw = raw_api.create(**kwargs)
+        return raw.parse(), raw.headers
+
+    async def _send_async(self, completions, kwargs):
+        raw_api = getattr(completions, 'with_raw_response', None)
+        if raw_api is None:
+            return await completions.create(**kwargs), None
+        raw = await raw_api.create(**kwargs)
+        return raw.parse(), raw.headers
+
+    def _failed(self, model_governor, error, attempt, call):
+        """Returns the delay before the next attempt, or re-raises if the call should not be retried."""
+        if attempt >= self.max_retries or not is_retryable(error):
+            raise error
+        delay = retry_delay(error, attempt)
+        if _status(error) == 429:
+            model_governor.back_off(delay)
+        if call is not None:
+            call['retries'] = call.get('retries', 0) + 1
+        return delay
+
+    def _succeeded(self, model_governor, estimate, completion, headers):
+        # A stream has no usage yet; its consumer settles it through settle_stream()
+        usage = getattr(completion, 'usage', None)
+        model_governor.settle(estimate, getattr(usage, 'total_tokens', None))
+        model_governor.observe(headers)
+        return completion
+
+    def create(self, client, call=None, **kwargs):
+        """Governed, retried client.chat.completions.create(**kwargs).
+
+        `call` is an optional telemetry record that gets the retry count and
+        the time spent waiting for the rate limit.
+        """
+        model_governor = self.for_model(kwargs['model'])
+        estimate = estimate_tokens(kwargs['messages'], kwargs.get('max_tokens'), kwargs.get('n', 1))
+        attempt = 0
+        while True:
+            wait = model_governor.acquire(estimate)
+            if wait > 0:
+                if call is not None:
+                    call['throttled'] = call.get('throttled', 0.0) + wait
+                time.sleep(wait)
+            try:
+                completion, headers = self._send(client.chat.completions, kwargs)
+            except Exception as e:
+                model_governor.settle(estimate, 0)
+                time.sleep(self._failed(model_governor, e, attempt, call))
+                attempt += 1
+                continue
+            return self._succeeded(model_governor, estimate, completion, headers)
+
+    def settle_stream(self, kwargs, total_tokens=None, completion_tokens=None):
+        """Corrects the reservation of a streamed create(**kwargs) call once it has been consumed.
+
+        Pass the total from the stream's usage chunk, or, for a stream closed
+        before it reported usage, the completion tokens actually received.
+        """
+        estimate = estimate_tokens(kwargs['messages'], kwargs.get('max_tokens'), kwargs.get('n', 1))
+        if total_tokens is None and completion_tokens is not None:
+            total_tokens = estimate_prompt_tokens(kwargs['messages']) + completion_tokens
+        self.for_model(kwargs['model']).settle(estimate, total_tokens)
+
+    async def create_async(self, client, call=None, **kwargs):
+        """Async counterpart of create() for AsyncOpenAI-style clients."""
+        import asyncio
+        model_governor = self.for_model(kwargs['model'])
+        estimate = estimate_tokens(kwargs['messages'], kwargs.get('max_tokens'), kwargs.get('n', 1))
+        attempt = 0
+        while True:
+            wait = model_governor.acquire(estimate)
+            if wait > 0:
+                if call is not None:
+                    call['throttled'] = call.get('throttled', 0.0) + wait
+                await asyncio.sleep(wait)
+            try:
+                completion, headers = await self._send_async(client.chat.completions, kwargs)
+            except Exception as e:
+                model_governor.settle(estimate, 0)
+                await asyncio.sleep(self._failed(model_governor, e, attempt, call))
+                attempt += 1
+                continue
+            return self._succeeded(model_governor, estimate, completion, headers)
+
+governor = Governor()
+
+def configure_governor(limits=None, max_retries=DEFAULT_MAX_RETRIES, assume_limits=True):
+    """Resets the shared governor, e.g. with {model: (rpm, tpm)} limits for another account tier."""
+    with governor._lock:
+        governor.limits = dict(MODEL_LIMITS, **(limits or {}))
+        governor.max_retries = max_retries
+        governor.assume_limits = assume_limits
+        governor._models.clear()
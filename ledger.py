@@ -0,0 +1,429 @@
+#==============================================================================
+# RUN LEDGER
+# SQLite store for runs, generated outputs and critic scores
+#==============================================================================
+
+import csv
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+
+LEDGER_PATH = 'runs.db'
+# WAL needs shared memory, so processes on several machines sharing the ledger
+# over a network filesystem must switch to a rollback journal (e.g. DELETE)
+JOURNAL_MODE = os.environ.get('TODO_LEDGER_JOURNAL', 'WAL')
+DEFAULT_MAX_ATTEMPTS = 3
+SCORES_CSV = 'analysis_scores.csv'
+CSV_FIELDS = ['Prompt', 'Output File', 'Score String', 'Total Score', 'Sample', 'Pre-score']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    mode TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    finished_at TEXT
+);
+CREATE TABLE IF NOT EXISTS generations (
+    file_id TEXT PRIMARY KEY,
+    run_id INTEGER,
+    model TEXT NOT NULL,
+    style TEXT NOT NULL,
+    task_file TEXT NOT NULL,
+    output_file TEXT NOT NULL,
+    ok INTEGER NOT NULL DEFAULT 1,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_generations_cell ON generations (model, style, task_file);
+CREATE INDEX IF NOT EXISTS idx_generations_output ON generations (output_file);
+CREATE TABLE IF NOT EXISTS scores (
+    output_file TEXT PRIMARY KEY,
+    run_id INTEGER,
+    prompt TEXT NOT NULL,
+    score_string TEXT NOT NULL,
+    total_score INTEGER NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_scores_prompt ON scores (prompt, total_score);
+CREATE TABLE IF NOT EXISTS prescores (
+    output_file TEXT PRIMARY KEY,
+    run_id INTEGER,
+    prescore REAL NOT NULL,
+    rejected INTEGER NOT NULL DEFAULT 0,
+    features TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    job_key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, lease_expires);
+CREATE TABLE IF NOT EXISTS retired (
+    output_file TEXT PRIMARY KEY,
+    retired_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+"""
+
+# (table, column, declaration) for columns added after the initial schema
+MIGRATIONS = [
+    ('generations', 'ok', 'INTEGER NOT NULL DEFAULT 1'),
+    ('generations', 'sample', 'INTEGER NOT NULL DEFAULT 0'),
+]
+
+def _now():
+    return datetime.datetime.now().isoformat(timespec='seconds')
+
+class Ledger:
+    """Indexed local store shared by every process working in the same directory."""
+
+    def __init__(self, path=LEDGER_PATH):
+        self.path = path
+        self.run_id = None
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        self._seed_counter()
+
+    def _migrate(self):
+        """Adds columns introduced after a ledger file was first created."""
+        for table, column, declaration in MIGRATIONS:
+            existing = [row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    def _seed_counter(self):
+        """Continues numbering from a legacy last_id.json the first time the ledger is created."""
+        last_id = 0
+        if os.path.exists('last_id.json'):
+            try:
+                with open('last_id.json', 'r') as f:
+                    last_id = int(json.load(f)['id'])
+            except (ValueError, KeyError):
+                pass
+        self.conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('file_id', ?)", (last_id,))
+
+    def _transaction(self, fn):
+        """Runs fn() inside a write transaction that excludes every other process."""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn()
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def allocate_id(self):
+        """Atomically reserves the next output ID, safe across threads and processes."""
+        def allocate():
+            self.conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'file_id'")
+            return self.conn.execute("SELECT value FROM counters WHERE name = 'file_id'").fetchone()[0]
+        return self._transaction(allocate)
+
+    #--------------------------------------------------------------------------
+    # RUNS
+    #--------------------------------------------------------------------------
+
+    def start_run(self, mode):
+        """Opens a run record; later generations and scores are tagged with it."""
+        with self._lock:
+            cursor = self.conn.execute("INSERT INTO runs (mode, started_at) VALUES (?, ?)", (mode, _now()))
+        self.run_id = cursor.lastrowid
+        return self.run_id
+
+    def finish_run(self):
+        if self.run_id is None:
+            return
+        with self._lock:
+            self.conn.execute("UPDATE runs SET finished_at = ? WHERE id = ?", (_now(), self.run_id))
+        self.run_id = None
+
+    #--------------------------------------------------------------------------
+    # GENERATIONS AND SCORES
+    #--------------------------------------------------------------------------
+
+    def record_generation(self, file_id, model, style, task_file, output_file, ok=True, sample=0):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO generations "
+                "(file_id, run_id, model, style, task_file, output_file, ok, sample, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (file_id, self.run_id, model, style, task_file, output_file, int(ok), sample, _now())
+            )
+
+    def record_score(self, output_file, prompt, score_string, total_score):
+        """Appends a score. The prompt is the style recorded with the output's generation; the
+        `prompt` argument is only used for outputs the ledger did not generate."""
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO scores (output_file, run_id, prompt, score_string, total_score, created_at) "
+                "VALUES (?, ?, COALESCE((SELECT style FROM generations WHERE output_file = ?), ?), ?, ?, ?)",
+                (output_file, self.run_id, output_file, prompt, score_string, total_score, _now())
+            )
+
+    def record_prescores(self, results):
+        """Stores {output file: prescore_todo() result} in one transaction."""
+        def record():
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO prescores (output_file, run_id, prescore, rejected, features, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                ((output_file, self.run_id, result['prescore'], int(result['rejected']),
+                  json.dumps(result['features']), _now()) for output_file, result in results.items())
+            )
+        self._transaction(record)
+
+    def prescore_pairs(self):
+        """Returns (pre-score, critic total) for every output that has both."""
+        return self.conn.execute(
+            "SELECT p.prescore, s.total_score FROM prescores p JOIN scores s ON s.output_file = p.output_file"
+        ).fetchall()
+
+    def rename_outputs(self, renames):
+        """Points generations, scores and pre-scores at new output names, e.g. after a store conversion.
+
+        Takes {old name: new name}; rows whose new name is already taken are
+        left alone. Returns the number of rows moved.
+        """
+        def rename():
+            before = self.conn.total_changes
+            for table in ('generations', 'scores', 'prescores'):
+                self.conn.executemany(f"UPDATE OR IGNORE {table} SET output_file = ? WHERE output_file = ?",
+                                      ((new, old) for old, new in renames.items()))
+            return self.conn.total_changes - before
+        return self._transaction(rename)
+
+    def completed_cells(self):
+        """Maps each successfully generated (model, style, task_file) cell to its (output file, sample) pairs, oldest first."""
+        rows = self.conn.execute(
+            "SELECT model, style, task_file, output_file, sample FROM generations WHERE ok = 1 ORDER BY rowid"
+        )
+        cells = {}
+        for model, style, task_file, output_file, sample in rows:
+            cells.setdefault((model, style, task_file), []).append((output_file, sample))
+        return cells
+
+    def scored_outputs(self):
+        """Returns the set of output files that already have a score."""
+        return {row[0] for row in self.conn.execute("SELECT output_file FROM scores")}
+
+    def retired_outputs(self):
+        """Returns the set of outputs retired because their prompt or task file changed or was deleted."""
+        return {row[0] for row in self.conn.execute("SELECT output_file FROM retired")}
+
+    def clear_generations(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM generations")
+            self.conn.execute("DELETE FROM retired")
+
+    def clear_scores(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM scores")
+            self.conn.execute("DELETE FROM prescores")
+
+    def export_csv(self, path=SCORES_CSV):
+        """Writes every score grouped by prompt and sorted by total score, in one pass.
+
+        Each row carries the sample index of its output (0 for outputs the
+        ledger did not generate) and its structural pre-score, if any. The CSV is written to a temporary file and
+        renamed into place, so concurrent exports never leave a half-written
+        file behind.
+        """
+        rows = self.conn.execute(
+            "SELECT COALESCE(g.style, s.prompt) AS prompt, s.output_file, s.score_string, s.total_score, "
+            "COALESCE(g.sample, 0), p.prescore "
+            "FROM scores s LEFT JOIN generations g ON g.output_file = s.output_file "
+            "LEFT JOIN prescores p ON p.output_file = s.output_file "
+            "ORDER BY prompt, s.total_score DESC, s.rowid"
+        )
+        count = 0
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_FIELDS)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        os.replace(tmp_path, path)
+        return count
+
+    #--------------------------------------------------------------------------
+    # WORK QUEUE
+    #--------------------------------------------------------------------------
+
+    def _insert_jobs(self, kind, jobs):
+        """Adds (job key, payload) pairs; finished or failed jobs with the same key are reset to pending."""
+        before = self.conn.total_changes
+        self.conn.executemany(
+            "INSERT INTO jobs (kind, job_key, payload, created_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (job_key) DO UPDATE SET payload = excluded.payload, status = 'pending', worker = NULL, "
+            "lease_expires = NULL, attempts = 0, error = NULL, finished_at = NULL "
+            "WHERE jobs.status IN ('done', 'failed')",
+            ((kind, key, json.dumps(payload), _now()) for key, payload in jobs)
+        )
+        return self.conn.total_changes - before
+
+    def enqueue_jobs(self, kind, jobs):
+        """Queues (job key, payload) pairs in one transaction. Returns the number added or re-queued."""
+        return self._transaction(lambda: self._insert_jobs(kind, jobs))
+
+    def claim_jobs(self, worker, limit, lease_seconds, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Leases up to `limit` pending jobs (or jobs whose lease ran out) to `worker`.
+
+        Jobs whose lease expired after max_attempts claims are marked failed
+        instead of being handed out again.
+        """
+        def claim():
+            now = time.time()
+            self.conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'lease expired', finished_at = ? "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (_now(), now, max_attempts)
+            )
+            rows = self.conn.execute(
+                "SELECT id, kind, payload FROM jobs "
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) ORDER BY id LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                ((worker, now + lease_seconds, job_id) for job_id, _, _ in rows)
+            )
+            return [{'id': job_id, 'kind': kind, 'payload': json.loads(payload)} for job_id, kind, payload in rows]
+        return self._transaction(claim)
+
+    def renew_leases(self, worker, job_ids, lease_seconds):
+        """Extends the leases `worker` still holds on job_ids."""
+        if not job_ids:
+            return
+        with self._lock:
+            self.conn.executemany(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                ((time.time() + lease_seconds, job_id, worker) for job_id in job_ids)
+            )
+
+    def complete_job(self, job_id, worker, follow_up=None):
+        """Marks a leased job done and queues follow-up jobs {kind: [(key, payload)]} in the same transaction.
+
+        Returns False (and queues nothing) if the lease was lost to another worker.
+        """
+        def complete():
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = 'done', finished_at = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (_now(), job_id, worker)
+            )
+            if cursor.rowcount == 0:
+                return False
+            for kind, jobs in (follow_up or {}).items():
+                self._insert_jobs(kind, jobs)
+            return True
+        return self._transaction(complete)
+
+    def fail_job(self, job_id, worker, error, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Returns a failed job to the queue, or marks it failed once it has used max_attempts."""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = ?, worker = NULL, lease_expires = NULL, "
+                "finished_at = CASE WHEN attempts >= ? THEN ? END "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (max_attempts, error, max_attempts, _now(), job_id, worker)
+            )
+
+    def jobs_outstanding(self):
+        """True while any job is pending or leased."""
+        row = self.conn.execute("SELECT 1 FROM jobs WHERE status IN ('pending', 'leased') LIMIT 1").fetchone()
+        return row is not None
+
+    def job_counts(self):
+        """Maps (kind, status) to the number of jobs."""
+        rows = self.conn.execute("SELECT kind, status, COUNT(*) FROM jobs GROUP BY kind, status")
+        return {(kind, status): count for kind, status, count in rows}
+
+    def clear_jobs(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM jobs")
+
+    #--------------------------------------------------------------------------
+    # WATCHED SOURCES
+    #--------------------------------------------------------------------------
+
+    def source_digests(self):
+        """Maps each prompt/task file to the content hash its current outputs were generated from."""
+        return dict(self.conn.execute("SELECT path, digest FROM sources"))
+
+    def record_sources(self, digests):
+        """Stores {path: digest} in one transaction; a digest of None forgets the path."""
+        def record():
+            for path, digest in digests.items():
+                if digest is None:
+                    self.conn.execute("DELETE FROM sources WHERE path = ?", (path,))
+                else:
+                    self.conn.execute("INSERT OR REPLACE INTO sources (path, digest, updated_at) VALUES (?, ?, ?)",
+                                      (path, digest, _now()))
+        self._transaction(record)
+
+    def retire_outputs(self, styles=(), task_files=()):
+        """Forgets every generation made from the given prompt styles or task files, and its scores.
+
+        Their names are kept in `retired` so outputs that cannot be deleted
+        (JSONL records) stay out of later runs. Returns the retired output
+        files so the caller can remove them.
+        """
+        styles, task_files = list(styles), list(task_files)
+        if not styles and not task_files:
+            return []
+        where = (f"style IN ({','.join('?' * len(styles))}) OR "
+                 f"task_file IN ({','.join('?' * len(task_files))})")
+        params = styles + task_files
+        def retire():
+            output_files = [row[0] for row in self.conn.execute(
+                f"SELECT output_file FROM generations WHERE {where}", params)]
+            for table in ('scores', 'prescores'):
+                self.conn.execute(
+                    f"DELETE FROM {table} WHERE output_file IN (SELECT output_file FROM generations WHERE {where})",
+                    params)
+            self.conn.execute(f"DELETE FROM generations WHERE {where}", params)
+            self.conn.executemany("INSERT OR IGNORE INTO retired (output_file, retired_at) VALUES (?, ?)",
+                                  ((output_file, _now()) for output_file in output_files))
+            return output_files
+        return self._transaction(retire)
+
+_ledger = None
+
+def get_ledger():
+    """Returns the process-wide ledger, opening it on first use."""
+    global _ledger
+    if _ledger is None:
+        _ledger = Ledger()
+    return _ledger
+
+def close_ledger():
+    """Closes the process-wide ledger so the next get_ledger() reopens it (e.g. after a chdir)."""
+    global _ledger
+    if _ledger is not None:
+        _ledger.conn.close()
+        _ledger = None
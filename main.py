@@ -3,46 +3,62 @@
 # Generates and evaluates todo lists using various language models and prompts
 #==============================================================================
 
-from openai import OpenAI
+import math
 import os
+import random
 import datetime
-from dotenv import load_dotenv
-import csv
-from critic import evaluate_todo, analyze_scores
+import hashlib
+from critic import (evaluate_todo, evaluate_todo_async, evaluate_todo_packed, analyze_scores, parse_score_string,
+                    parse_critic_reply, configure_critic, critic_model, critic_constrained, critic_request,
+                    supports_structured_output, CRITIC_MODEL, CONSTRAINED_CRITIC_MODEL)
+from batch import build_request, submit_batch, OpenAIBatchTransport, LocalBatchTransport, DEFAULT_POLL_INTERVAL
+from backends import configure_backend, backend_name, get_client, get_async_client, get_fake_llm, BACKENDS
+from cache import response_cache, configure_cache
+from telemetry import telemetry
+from governor import governor, configure_governor, DEFAULT_MAX_RETRIES
+from streaming import configure_streaming, streaming_enabled, output_cap, consume_stream, load_style_caps, STYLE_CAPS_FILE
+from ledger import get_ledger
+from output_store import (parse_output_text, configure_output, output_backend, get_output_store,
+                          convert_text_outputs, OUTPUT_BACKENDS, STORE_DIR)
+from aggregate import load_score_columns, summarize_scores, format_summary, prescore_agreement, format_agreement
+from prescore import configure_prescore, prescore_enabled, prescore_todo, critic_wanted, select_for_critic
 import argparse
 import glob
-import json
-from tqdm import tqdm
 import shutil
+import socket
+import time
 
 #------------------------------------------------------------------------------
 # INITIALIZATION AND ENVIRONMENT SETUP
 #------------------------------------------------------------------------------
 
-load_dotenv()
-client = OpenAI()
+# Model clients come from backends.py and are only created when a stage first
+# needs one, so local-only modes and the fake backend never need an API key.
+# Heavier third-party imports are likewise deferred to the stages that use them.
+MODELS = ["gpt-4o-mini", "gpt-3.5-turbo"]
+DEFAULT_CONCURRENCY = 8
+DEFAULT_CRITIC_CONCURRENCY = 4
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_PACK_SIZE = 1
+DEFAULT_ADAPTIVE_BUDGET = 200
+DEFAULT_KEEP_FRACTION = 0.5
+DEFAULT_INITIAL_TASKS = 2
+DEFAULT_LEASE_SECONDS = 300
+QUEUE_POLL_INTERVAL = 2
+DEFAULT_WATCH_INTERVAL = 1.0
 
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-if not OPENAI_API_KEY:
-  raise ValueError("OpenAI API key not found. Ensure it's in the .env file.")
+def progress_bar(**kwargs):
+    """Creates a tqdm progress bar, importing tqdm on first use."""
+    from tqdm import tqdm
+    return tqdm(**kwargs)
 
 #------------------------------------------------------------------------------
 # DIRECTORY AND FILE MANAGEMENT 
 #------------------------------------------------------------------------------
 
 def get_next_id():
-   """Get next available ID from 001-999"""
-   try:
-       with open('last_id.json', 'r') as f:
-           last_id = json.load(f)['id']
-   except FileNotFoundError:
-       last_id = 0
-   
-   next_id = (last_id + 1) % 1000
-   with open('last_id.json', 'w') as f:
-       json.dump({'id': next_id}, f)
-   
-   return f"{next_id:03d}"
+   """Get next available output ID, allocated atomically from the run ledger."""
+   return f"{get_ledger().allocate_id():03d}"
 
 def setup_directory_structure(clear=False, mode=None):
     """Creates/manages directory structure for the project."""
@@ -50,13 +66,25 @@ def setup_directory_structure(clear=False, mode=None):
     created = []
     existed = []
     
-    # Only clear output directory if we're in generate mode
+    # Only clear output directory if we're in a mode that generates
     if clear:
-        if mode == 'generate' and os.path.exists('output'):
-            shutil.rmtree('output')
-            print("Cleared output directory")
-        elif mode == 'evaluate' and os.path.exists('analysis_scores.csv'):
+        if mode == 'enqueue':
+            get_ledger().clear_jobs()
+            print("Cleared work queue")
+        if mode in ('generate', 'run', 'enqueue'):
+            # Only the active backend's outputs are cleared; the other backend's are left alone
+            if output_backend() == 'jsonl':
+                if os.path.exists(STORE_DIR):
+                    shutil.rmtree(STORE_DIR)
+                    get_ledger().clear_generations()
+                    print("Cleared output store")
+            elif os.path.exists('output'):
+                shutil.rmtree('output')
+                get_ledger().clear_generations()
+                print("Cleared output directory")
+        if mode in ('evaluate', 'run', 'enqueue') and os.path.exists('analysis_scores.csv'):
             os.remove('analysis_scores.csv')
+            get_ledger().clear_scores()
             print("Cleared previous analysis scores")
     
     for dir_name in required_dirs:
@@ -87,32 +115,83 @@ def setup_directory_structure(clear=False, mode=None):
 # TODO LIST GENERATION
 #------------------------------------------------------------------------------
 
-def prompt(language_model, system_prompt, task_definition):
-   """Generates a todo list using specified language model and prompts."""
-   try:
-       completion = client.chat.completions.create(
-           model=language_model,
-           store=True,
-           messages=[
-               {"role": "system", "content": system_prompt},
-               {"role": "user", "content": task_definition}
-           ]
-       )
-       return completion.choices[0].message.content
-   except Exception as e:
-       print(f"Error while generating prompt: {e}")
-       return ""
+async def prompt_samples_async(language_model, system_prompt, task_definition, samples=1, style=None, task=None,
+                               sample_indices=None):
+    """Requests `samples` completions in a single n=samples call and returns them as a list ([] on failure).
+
+    The prompt style's output cap is sent as max_tokens. In streaming mode the
+    tokens are consumed as they arrive and time to first token is recorded.
+    `sample_indices` names the samples being filled; any set other than
+    0..samples-1 (a resumed cell) gets its own cache entry, so a missing
+    sample is never answered with the cached text of another one.
+    """
+    params = {'n': samples} if samples > 1 else {}
+    cap = output_cap(style)
+    if cap:
+        params['max_tokens'] = cap
+    cache_params = dict(params)
+    if sample_indices is not None and list(sample_indices) != list(range(samples)):
+        cache_params['sample_indices'] = list(sample_indices)
+    cache_key = response_cache.make_key(language_model, system_prompt, task_definition, **cache_params)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached if samples > 1 else [cached]
+
+    request = dict(
+        model=language_model,
+        store=True,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": task_definition}
+        ],
+        **params
+    )
+    try:
+        with telemetry.track('generate', language_model, style, task) as call:
+            if streaming_enabled():
+                stream = await governor.create_async(get_async_client(), call, stream=True,
+                                                     stream_options={"include_usage": True}, **request)
+                results = await consume_stream(stream, call, samples, cap,
+                                               lambda total, completion: governor.settle_stream(request, total, completion))
+            else:
+                completion = await governor.create_async(get_async_client(), call, **request)
+                call.usage(completion.usage)
+                results = [choice.message.content for choice in completion.choices]
+                call['capped'] = any(choice.finish_reason == 'length' for choice in completion.choices)
+        response_cache.put(cache_key, results if samples > 1 else results[0])
+        return results
+    except Exception as e:
+        print(f"Error while generating prompt: {e}")
+        return []
 
 #------------------------------------------------------------------------------
 # OUTPUT AND ANALYSIS
 #------------------------------------------------------------------------------
 
-def save_to_file(language_model, style_name, task_filename, task_definition, results, scores=None):
-   """Saves the complete output (todo list and metadata) to a text file."""
+def save_to_file(language_model, style_name, task_filename, task_definition, results, scores=None, sample=0):
+   """Saves the complete output (todo list and metadata) to a text file or the JSONL store."""
    file_id = get_next_id()
    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S%f")
    task_name = os.path.splitext(os.path.basename(task_filename))[0]
-   filename = f"{file_id}_{task_name}_{style_name}_{language_model}_{timestamp}.txt"
+   output_id = f"{file_id}_{task_name}_{style_name}_{language_model}_{timestamp}"
+
+   if output_backend() == 'jsonl':
+       filename = get_output_store().append({
+           'id': output_id,
+           'model': language_model,
+           'style': style_name,
+           'task_file': task_filename,
+           'task_definition': task_definition,
+           'results': results,
+           'scores': scores,
+           'sample': sample,
+           'created_at': timestamp,
+       })
+       get_ledger().record_generation(file_id, language_model, style_name, task_filename, filename,
+                                      ok=bool(results), sample=sample)
+       return filename
+
+   filename = f"{output_id}.txt"
    output_dir = "output"
    os.makedirs(output_dir, exist_ok=True)
    filepath = os.path.join(output_dir, filename)
@@ -121,6 +200,7 @@ def save_to_file(language_model, style_name, task_filename, task_definition, res
 Language Model: {language_model}
 System Prompt: {style_name}
 Task File: {task_filename}
+Sample: {sample}
 Task Definition: {task_definition}
 Results: {results}
 """
@@ -129,97 +209,198 @@ Results: {results}
        
    with open(filepath, "w") as file:
        file.write(file_contents)
+   get_ledger().record_generation(file_id, language_model, style_name, task_filename, filename,
+                                  ok=bool(results), sample=sample)
    return filename
 
-def save_scores_csv(output_filename, scores_string, total_score):
-   """Saves and organizes evaluation scores in CSV file."""
-   scores_data = []
-   
-   if os.path.exists('analysis_scores.csv'):
-       with open('analysis_scores.csv', 'r') as f:
-           reader = csv.DictReader(f)
-           scores_data = list(reader)
-   
-   scores_data.append({
-       'Output File': output_filename,
-       'Score String': scores_string,
-       'Total Score': total_score,
-       'Prompt': output_filename.split('_')[2]
-   })
-   
-   grouped_data = {}
-   for row in scores_data:
-       prompt = row['Prompt']
-       if prompt not in grouped_data:
-           grouped_data[prompt] = []
-       grouped_data[prompt].append(row)
-   
-   for prompt in grouped_data:
-       grouped_data[prompt].sort(key=lambda x: float(x['Total Score']), reverse=True)
-   
-   with open('analysis_scores.csv', 'w', newline='') as f:
-       writer = csv.DictWriter(f, fieldnames=['Prompt', 'Output File', 'Score String', 'Total Score'])
-       writer.writeheader()
-       for prompt in sorted(grouped_data.keys()):
-           for row in grouped_data[prompt]:
-               writer.writerow(row)
+def save_score(output_filename, scores_string, total_score):
+   """Appends one evaluation score to the run ledger.
+
+   The ledger files it under the prompt style recorded at generation time; the
+   name parsed from the file name is only a fallback for outputs it did not generate.
+   """
+   prompt_name = output_filename.split('_')[2]
+   get_ledger().record_score(output_filename, prompt_name, scores_string, total_score)
+
+def save_scores_csv():
+   """Exports all ledger scores to analysis_scores.csv, grouped by prompt and sorted by score."""
+   count = get_ledger().export_csv('analysis_scores.csv')
+   print(f"Exported {count} scores to analysis_scores.csv")
 
 #------------------------------------------------------------------------------
 # MAIN EXECUTION FUNCTIONS
 #------------------------------------------------------------------------------
 
-def run_generation():
-   """Runs todo list generation with progress bar."""
-   print("Running todo list generation...")
-   
-   models = ["gpt-4o-mini", "gpt-3.5-turbo"]
-   prompt_dir = "prompts"
-   if not os.path.exists(prompt_dir):
-       raise FileNotFoundError(f"Prompt directory '{prompt_dir}' does not exist.")
+def load_generation_grid(models=MODELS, prompt_dir="prompts", task_dir="tasks", samples=1):
+    """Builds the list of (model, prompt style, task) cells to generate, each asking for `samples` outputs."""
+    if not os.path.exists(prompt_dir):
+        raise FileNotFoundError(f"Prompt directory '{prompt_dir}' does not exist.")
+    if not os.path.exists(task_dir):
+        raise FileNotFoundError(f"Task directory '{task_dir}' does not exist.")
 
-   prompt_styles = {
-       os.path.splitext(filename)[0]: os.path.join(prompt_dir, filename)
-       for filename in os.listdir(prompt_dir) if filename.endswith(".md")
-   }
+    prompt_styles = {}
+    for filename in sorted(os.listdir(prompt_dir)):
+        if filename.endswith(".md"):
+            with open(os.path.join(prompt_dir, filename), "r") as file:
+                prompt_styles[os.path.splitext(filename)[0]] = file.read().strip()
 
-   task_dir = "tasks"
-   if not os.path.exists(task_dir):
-       raise FileNotFoundError(f"Task directory '{task_dir}' does not exist.")
+    task_definitions = {}
+    for filename in sorted(os.listdir(task_dir)):
+        if filename.endswith(".md"):
+            task_file = os.path.join(task_dir, filename)
+            with open(task_file, "r") as file:
+                task_definitions[task_file] = file.read().strip()
 
-   task_files = [os.path.join(task_dir, file) for file in os.listdir(task_dir) if file.endswith(".md")]
+    cells = []
+    for language_model in models:
+        for style_name, system_prompt in prompt_styles.items():
+            for task_file, task_definition in task_definitions.items():
+                cells.append({
+                    'model': language_model,
+                    'style': style_name,
+                    'system_prompt': system_prompt,
+                    'task_file': task_file,
+                    'task_definition': task_definition,
+                    'samples': samples,
+                    'sample_indices': list(range(samples)),
+                })
+    return cells
+
+def cell_key(cell):
+    return (cell['model'], cell['style'], cell['task_file'])
+
+def completed_outputs():
+    """Maps finished cells to their (output file, sample) pairs, ignoring records whose file has been removed."""
+    if output_backend() == 'jsonl':
+        stored = set(get_output_store().ids())
+        exists = lambda output_file: output_file in stored
+    else:
+        exists = lambda output_file: os.path.exists(os.path.join('output', output_file))
+    completed = {}
+    for key, outputs in get_ledger().completed_cells().items():
+        existing = [(output_file, sample) for output_file, sample in outputs if exists(output_file)]
+        if existing:
+            completed[key] = existing
+    return completed
+
+def missing_samples(cell, outputs):
+    """Sample indices a cell still lacks given its (output file, sample) pairs, lowest free indices first."""
+    have = {sample for _, sample in outputs}
+    missing = []
+    index = 0
+    while len(have) + len(missing) < cell.get('samples', 1):
+        if index not in have:
+            missing.append(index)
+        index += 1
+    return missing
+
+def pending_cells(cells, resume=False):
+    """When resuming, drops cells that already have all their samples and asks the rest only for the missing ones."""
+    if not resume:
+        return cells
+    done = completed_outputs()
+    remaining = []
+    for cell in cells:
+        missing = missing_samples(cell, done.get(cell_key(cell), []))
+        if missing:
+            remaining.append(dict(cell, samples=len(missing), sample_indices=missing))
+    print(f"Resuming: {len(cells) - len(remaining)} cells already generated, {len(remaining)} remaining.")
+    return remaining
+
+def save_samples(cell, samples):
+    """Saves each generated sample of a cell as its own output; returns [(output file, todo list)].
+
+    A failed request is saved as one empty output per requested sample, so
+    resume sees each of them as unfinished and callers get one entry per sample.
+    """
+    indices = cell.get('sample_indices') or list(range(cell.get('samples', 1)))
+    if not samples:
+        samples = [""] * len(indices)
+    return [
+        (save_to_file(cell['model'], cell['style'], cell['task_file'], cell['task_definition'], results,
+                      sample=sample), results)
+        for sample, results in zip(indices, samples)
+    ]
+
+async def generate_cell(cell, semaphore):
+    """Generates and saves a single grid cell, all its samples in one request, bounded by the shared semaphore."""
+    async with semaphore:
+        samples = await prompt_samples_async(cell['model'], cell['system_prompt'], cell['task_definition'],
+                                             cell.get('samples', 1), cell['style'], cell['task_file'],
+                                             cell.get('sample_indices'))
+    return save_samples(cell, samples)
+
+async def run_prefix_groups(cells, handle):
+    """Awaits handle(index, cell) for every cell, scheduled by shared prompt prefix.
+
+    Cells are grouped by (model, system prompt), longest prompts first. The
+    first request of each group goes out alone so the provider can cache the
+    shared prefix; the rest of the group is released together as soon as it
+    returns, so they all land on the warm cache.
+    """
+    import asyncio
+    groups = {}
+    for index, cell in enumerate(cells):
+        groups.setdefault((cell['model'], cell['system_prompt']), []).append((index, cell))
+    ordered = sorted(groups.values(), key=lambda group: -len(group[0][1]['system_prompt']))
+
+    async def run_group(group):
+        await handle(*group[0])
+        await asyncio.gather(*(handle(index, cell) for index, cell in group[1:]))
+
+    await asyncio.gather(*(run_group(group) for group in ordered))
+
+async def run_generation_async(cells, concurrency=DEFAULT_CONCURRENCY):
+    """Runs all cells concurrently, updating the progress bar as each one finishes."""
+    import asyncio
+    semaphore = asyncio.Semaphore(concurrency)
+
+    with progress_bar(total=len(cells), desc="Generating todo lists") as pbar:
+        async def handle(index, cell):
+            try:
+                await generate_cell(cell, semaphore)
+            except Exception as e:
+                print(f"\nError: {e}")
+            pbar.update(1)
+
+        await run_prefix_groups(cells, handle)
+
+def run_generation(concurrency=DEFAULT_CONCURRENCY, resume=False, samples=1):
+    """Runs todo list generation with progress bar."""
+    import asyncio
+    print("Running todo list generation...")
+
+    cells = pending_cells(load_generation_grid(samples=samples), resume)
+    if samples > 1:
+        print(f"Generating {sum(cell['samples'] for cell in cells)} samples for {len(cells)} cells "
+              f"(up to n={samples} per request), concurrency {concurrency}.")
+    else:
+        print(f"Generating {len(cells)} todo lists with concurrency {concurrency}.")
+
+    ledger = get_ledger()
+    ledger.start_run('generate')
+    try:
+        asyncio.run(run_generation_async(cells, concurrency))
+    except KeyboardInterrupt:
+        print("\nProgram interrupted by user. Rerun with --resume to continue.")
+    finally:
+        ledger.finish_run()
+
+def find_output_files():
+    """Lists outputs to evaluate, printing diagnostics when there are none."""
+    if output_backend() == 'jsonl':
+        # Records retired by watch mode stay in the shards until --clear; skip them
+        retired = get_ledger().retired_outputs()
+        output_ids = [output_id for output_id in get_output_store().ids() if output_id not in retired]
+        print(f"Found {len(output_ids)} stored outputs to evaluate.")
+        if not output_ids:
+            print("The output store is empty. Have you run generation with --output-backend jsonl?")
+        return output_ids
 
-   total_tasks = len(models) * len(prompt_styles) * len(task_files)
-   
-   try:
-       with tqdm(total=total_tasks, desc="Generating todo lists") as pbar:
-           for language_model in models:
-               for style_name, prompt_file in prompt_styles.items():
-                   with open(prompt_file, "r") as file:
-                       system_prompt = file.read().strip()
-                   
-                   for task_file in task_files:
-                       with open(task_file, "r") as file:
-                           task_definition = file.read().strip()
-                       
-                       try:
-                           results = prompt(language_model, system_prompt, task_definition)
-                           save_to_file(language_model, style_name, task_file, task_definition, results)
-                           pbar.update(1)
-                       except Exception as e:
-                           print(f"\nError: {e}")
-                           pbar.update(1)
-
-   except KeyboardInterrupt:
-       print("\nProgram interrupted by user. Exiting...")
-
-def run_critic():
-    """Runs critic evaluation on existing output files."""
-    print("Running critic evaluation...")
-    
     # Check if output directory exists
     if not os.path.exists('output'):
         print("Output directory not found. Please run generation first.")
-        return
+        return []
         
     output_files = glob.glob('output/*.txt')
     
@@ -228,37 +409,722 @@ def run_critic():
     if len(output_files) == 0:
         print("No .txt files found in output directory. Have you run generation first?")
         # List what files ARE in the output directory, if any
-        if os.path.exists('output'):
-            files_in_output = os.listdir('output')
-            if files_in_output:
-                print("Files found in output directory:", files_in_output)
-            else:
-                print("Output directory is empty.")
+        files_in_output = os.listdir('output')
+        if files_in_output:
+            print("Files found in output directory:", files_in_output)
+        else:
+            print("Output directory is empty.")
+    return output_files
+
+def read_results_section(output_file):
+    """Extracts the generated todo list from an output file or stored record."""
+    if output_backend() == 'jsonl':
+        return get_output_store().get(output_file)['results']
+    with open(output_file, 'r') as f:
+        return parse_output_text(f.read())['results']
+
+def iter_results(output_files):
+    """Yields (output file, todo list) pairs; the todo list is None if it could not be read.
+
+    With the JSONL backend the shards are streamed sequentially instead of
+    seeking to each record.
+    """
+    if output_backend() == 'jsonl':
+        wanted = set(output_files)
+        for record in get_output_store().iter_records():
+            if record['id'] in wanted:
+                wanted.discard(record['id'])
+                yield record['id'], record['results']
+        for missing in wanted:
+            print(f"\nError processing {missing}: not found in output store")
+            yield missing, None
         return
+
+    for output_file in output_files:
+        try:
+            yield output_file, read_results_section(output_file)
+        except Exception as e:
+            print(f"\nError processing {output_file}: {e}")
+            yield output_file, None
+
+def record_scores(output_file, scores):
+    """Totals a critic score string, appends it to the ledger and returns the total."""
+    score_list = [int(x) for x in scores.split(',')]
+    total_score = sum(score_list)
+    save_score(os.path.basename(output_file), scores, total_score)
+    return total_score
+
+def pending_output_files(output_files, resume=False):
+    """Selects outputs to score: all of them after clearing old scores, or only unscored ones when resuming."""
+    if not resume:
+        get_ledger().clear_scores()
+        return output_files
+    scored = get_ledger().scored_outputs()
+    remaining = [f for f in output_files if os.path.basename(f) not in scored]
+    print(f"Resuming: {len(output_files) - len(remaining)} outputs already scored, {len(remaining)} remaining.")
+    return remaining
+
+def score_packed(todo_lists, pbar):
+    """Scores a group of {output file: todo list} with one packed critic request."""
+    for output_file, scores in evaluate_todo_packed(get_client(), todo_lists).items():
+        try:
+            if scores:
+                record_scores(output_file, scores)
+        except Exception as e:
+            print(f"\nError processing {output_file}: {e}")
+        pbar.update(1)
+
+def prescreen_outputs(output_files):
+    """Pre-scores outputs locally and returns those still worth a critic call.
+
+    Without --prescore every output is returned. With it, each structural
+    pre-score is stored in the ledger next to the critic scores, and junk,
+    lists outside --critic-band and lists below the --critic-top fraction
+    are held back from the critic.
+    """
+    if not prescore_enabled():
+        return output_files
+    results = {}
+    for output_file, todo_list in iter_results(output_files):
+        if todo_list is not None:
+            results[output_file] = prescore_todo(todo_list)
+    get_ledger().record_prescores({os.path.basename(f): result for f, result in results.items()})
+    selected = select_for_critic(results)
+    rejected = sum(1 for result in results.values() if result['rejected'])
+    print(f"Pre-scored {len(results)} outputs: {rejected} rejected as junk, "
+          f"{len(results) - rejected - len(selected)} triaged out, {len(selected)} left for the critic.")
+    return [f for f in output_files if f in selected]
+
+def prescreen_one(output_file, todo_list):
+    """Streaming counterpart of prescreen_outputs() for a single output; --critic-top does not apply."""
+    if not prescore_enabled():
+        return True
+    result = prescore_todo(todo_list)
+    get_ledger().record_prescores({os.path.basename(output_file): result})
+    return critic_wanted(result)
+
+def print_prescore_agreement():
+    """Prints how closely the stored pre-scores track the critic, once both exist for some outputs."""
+    agreement = prescore_agreement(get_ledger().prescore_pairs())
+    if agreement['n']:
+        print(format_agreement(agreement))
+
+def run_prescoring():
+    """Pre-scores every output locally, with no model calls, and reports agreement with existing critic scores."""
+    print("Running structural pre-scoring...")
+    output_files = find_output_files()
+    if not output_files:
+        return
+    configure_prescore(True)
+    ledger = get_ledger()
+    ledger.start_run('prescore')
+    prescreen_outputs(output_files)
+    ledger.finish_run()
+    print_prescore_agreement()
+    save_scores_csv()
+
+def run_critic(resume=False, pack_size=DEFAULT_PACK_SIZE):
+    """Runs critic evaluation on existing output files."""
+    print("Running critic evaluation...")
     
-    with open("analysis_scores.csv", 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(['Prompt', 'Output File', 'Score String', 'Total Score'])
+    output_files = find_output_files()
+    if not output_files:
+        return
+    output_files = pending_output_files(output_files, resume)
     
-    with tqdm(total=len(output_files), desc="Evaluating outputs") as pbar:
-        for output_file in output_files:
-            try:
-                with open(output_file, 'r') as f:
-                    content = f.read()
-                    results_section = content.split('Results:')[1].split('Scores:')[0].strip()
-                
-                scores = evaluate_todo(client, results_section)
-                if scores:
-                    score_list = [int(x) for x in scores.split(',')]
-                    total_score = sum(score_list)
-                    save_scores_csv(os.path.basename(output_file), scores, total_score)
+    ledger = get_ledger()
+    ledger.start_run('evaluate')
+    output_files = prescreen_outputs(output_files)
+    
+    try:
+        with progress_bar(total=len(output_files), desc="Evaluating outputs") as pbar:
+            pack = {}
+            for output_file, results_section in iter_results(output_files):
+                # Failed generations come back empty; there is nothing to score
+                if not results_section:
+                    pbar.update(1)
+                    continue
+                if pack_size > 1:
+                    pack[output_file] = results_section
+                    if len(pack) == pack_size:
+                        score_packed(pack, pbar)
+                        pack = {}
+                    continue
+                try:
+                    scores = evaluate_todo(get_client(), results_section)
+                    if scores:
+                        record_scores(output_file, scores)
+                except Exception as e:
+                    print(f"\nError processing {output_file}: {e}")
                 pbar.update(1)
-                
+            if pack:
+                score_packed(pack, pbar)
+    except KeyboardInterrupt:
+        print("\nProgram interrupted by user. Rerun with --resume to continue.")
+
+    ledger.finish_run()
+    print_prescore_agreement()
+    save_scores_csv()
+
+#------------------------------------------------------------------------------
+# STREAMING PIPELINE
+#------------------------------------------------------------------------------
+
+async def run_pipeline_async(cells, concurrency=DEFAULT_CONCURRENCY,
+                             critic_concurrency=DEFAULT_CRITIC_CONCURRENCY, queue_size=DEFAULT_QUEUE_SIZE,
+                             unscored=()):
+    """Generates cells and scores each todo list as soon as it is produced.
+
+    Generated lists flow to critic workers through a bounded queue, so both
+    stages overlap and nothing is re-read from disk. `unscored` holds
+    (output file, todo list) pairs left over from an interrupted run; they go
+    straight to the critic. Returns {cell index: total score} for the cells
+    that were generated and scored.
+    """
+    import asyncio
+    queue = asyncio.Queue(maxsize=queue_size)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    gen_bar = progress_bar(total=len(cells), desc="Generating todo lists", position=0)
+    eval_bar = progress_bar(total=sum(cell.get('samples', 1) for cell in cells) + len(unscored),
+                            desc="Evaluating outputs", position=1)
+
+    async def feed_unscored():
+        for filename, results in unscored:
+            await queue.put((filename, results, None))
+
+    totals = {}
+
+    async def produce(index, cell):
+        try:
+            outputs = await generate_cell(cell, semaphore)
+        except Exception as e:
+            print(f"\nError: {e}")
+            outputs = [(None, "")] * cell.get('samples', 1)
+        gen_bar.update(1)
+        for filename, results in outputs:
+            await queue.put((filename, results, index))
+
+    async def consume():
+        while True:
+            item = await queue.get()
+            if item is None:
+                queue.task_done()
+                return
+            filename, results, index = item
+            try:
+                # Failed generations come back empty; there is nothing to score
+                if filename and results and prescreen_one(filename, results):
+                    scores = await evaluate_todo_async(get_async_client(), results)
+                    if scores:
+                        total_score = record_scores(filename, scores)
+                        if index is not None:
+                            totals[index] = total_score
             except Exception as e:
-                print(f"\nError processing {output_file}: {e}")
-                pbar.update(1)
+                print(f"\nError processing {filename}: {e}")
+            eval_bar.update(1)
+            queue.task_done()
+
+    consumers = [asyncio.create_task(consume()) for _ in range(critic_concurrency)]
+    try:
+        await asyncio.gather(feed_unscored(), run_prefix_groups(cells, produce))
+        for _ in consumers:
+            await queue.put(None)
+        await asyncio.gather(*consumers)
+    finally:
+        gen_bar.close()
+        eval_bar.close()
+    return totals
+
+def pending_pipeline_work(cells, samples=1):
+    """Splits the grid into cells still missing samples and (output file, todo list) pairs still unscored."""
+    done = completed_outputs()
+    scored = get_ledger().scored_outputs()
+    remaining = []
+    unscored = []
+    for cell in cells:
+        outputs = done.get(cell_key(cell), [])
+        for output_file, _ in outputs:
+            if output_file not in scored:
+                unscored.append((output_file, read_results_section(output_path(output_file))))
+        missing = missing_samples(cell, outputs)
+        if missing:
+            remaining.append(dict(cell, samples=len(missing), sample_indices=missing))
+    return remaining, unscored
+
+def run_pipeline(concurrency=DEFAULT_CONCURRENCY, critic_concurrency=DEFAULT_CRITIC_CONCURRENCY,
+                 queue_size=DEFAULT_QUEUE_SIZE, resume=False, samples=1):
+    """Runs generation and critic scoring as one overlapping pass."""
+    import asyncio
+    print("Running streaming generate -> evaluate pipeline...")
+
+    ledger = get_ledger()
+    cells = load_generation_grid(samples=samples)
+    unscored = []
+    if resume:
+        remaining, unscored = pending_pipeline_work(cells, samples)
+        print(f"Resuming: {len(cells) - len(remaining)} cells already generated, "
+              f"{len(unscored)} of them still to score, {len(remaining)} to generate.")
+        cells = remaining
+
+    print(f"Processing {len(cells)} todo lists with concurrency {concurrency} "
+          f"and {critic_concurrency} critic workers.")
+
+    ledger.start_run('run')
+    try:
+        asyncio.run(run_pipeline_async(cells, concurrency, critic_concurrency, queue_size, unscored))
+    except KeyboardInterrupt:
+        print("\nProgram interrupted by user. Rerun with --resume to continue.")
+    finally:
+        ledger.finish_run()
+    print_prescore_agreement()
+    save_scores_csv()
+
+#------------------------------------------------------------------------------
+# ADAPTIVE SEARCH
+#------------------------------------------------------------------------------
+
+def run_adaptive_generation(budget=DEFAULT_ADAPTIVE_BUDGET, keep_fraction=DEFAULT_KEEP_FRACTION,
+                            initial_tasks=DEFAULT_INITIAL_TASKS, concurrency=DEFAULT_CONCURRENCY,
+                            critic_concurrency=DEFAULT_CRITIC_CONCURRENCY, seed=0):
+    """Successive halving over (model, prompt style) arms.
+
+    Each round samples unseen tasks for every surviving arm, generates and
+    scores them, then keeps only the best keep_fraction of arms. The round
+    budget is split evenly across rounds; every sample costs two calls
+    (generation plus critic). When the budget cuts a round short, samples
+    are dealt out round-robin so every arm still gets some. Arms left
+    without a score (cut off, or every critic call failed) are not ranked;
+    they carry over to the next round instead of being dropped.
+    """
+    import asyncio
+    print("Running adaptive todo list generation...")
+
+    rng = random.Random(seed)
+    arms = {}
+    for cell in load_generation_grid():
+        arms.setdefault((cell['model'], cell['style']), []).append(cell)
+    for arm_cells in arms.values():
+        rng.shuffle(arm_cells)
+
+    rounds = max(1, math.ceil(math.log(len(arms)) / math.log(1 / keep_fraction))) if len(arms) > 1 else 1
+    print(f"{len(arms)} arms, {rounds} rounds, budget {budget} calls.")
+
+    surviving = list(arms)
+    scores = {arm: [] for arm in arms}
+    sampled = {arm: 0 for arm in arms}
+    spent = 0
+
+    ledger = get_ledger()
+    ledger.start_run('adaptive')
+    try:
+        for round_number in range(1, rounds + 1):
+            remaining_rounds = rounds - round_number + 1
+            per_arm = max(initial_tasks if round_number == 1 else 1,
+                          (budget - spent) // (2 * len(surviving) * remaining_rounds))
+            limit = max(0, (budget - spent) // 2)
+            round_cells, round_arms = [], []
+            for _ in range(per_arm):
+                for arm in surviving:
+                    if len(round_cells) < limit and sampled[arm] < len(arms[arm]):
+                        round_cells.append(arms[arm][sampled[arm]])
+                        round_arms.append(arm)
+                        sampled[arm] += 1
+            if not round_cells:
+                print("Budget or tasks exhausted.")
+                break
+
+            print(f"\nRound {round_number}: {len(surviving)} arms, {len(round_cells)} samples")
+            totals = asyncio.run(run_pipeline_async(round_cells, concurrency, critic_concurrency))
+            spent += 2 * len(round_cells)
+            for index, total_score in totals.items():
+                scores[round_arms[index]].append(total_score)
+
+            ranking = sorted((arm for arm in surviving if scores[arm]),
+                             key=lambda arm: -sum(scores[arm]) / len(scores[arm]))
+            unscored = [arm for arm in surviving if not scores[arm]]
+            for arm in ranking:
+                print(f"  {arm[0]:<16} {arm[1]:<40} n={len(scores[arm]):<4} "
+                      f"mean={sum(scores[arm]) / len(scores[arm]):.2f}")
+            for arm in unscored:
+                print(f"  {arm[0]:<16} {arm[1]:<40} n=0    not scored yet, kept")
+
+            if len(surviving) == 1:
+                break
+            surviving = ranking[:max(1, math.ceil(len(ranking) * keep_fraction))] if ranking else []
+            surviving += unscored
+    except KeyboardInterrupt:
+        print("\nProgram interrupted by user. Exiting...")
+    finally:
+        ledger.finish_run()
+
+    best = next((arm for arm in surviving if scores[arm]), None)
+    if best:
+        print(f"\nSpent {spent} of {budget} calls. Best arm: {best[0]} / {best[1]}")
+    else:
+        print(f"\nSpent {spent} of {budget} calls. No arm was scored.")
+    save_scores_csv()
+
+#------------------------------------------------------------------------------
+# WORK QUEUE
+#------------------------------------------------------------------------------
+
+def output_path(output_file):
+    """Turns a saved output name into the form read_results_section() expects."""
+    return output_file if output_backend() == 'jsonl' else os.path.join('output', output_file)
+
+def print_queue_status():
+    counts = get_ledger().job_counts()
+    for kind in ('generate', 'evaluate'):
+        statuses = {status: count for (job_kind, status), count in counts.items() if job_kind == kind}
+        if statuses:
+            print(f"  {kind:<9} " + ", ".join(f"{status} {count}" for status, count in sorted(statuses.items())))
+
+def enqueue_work(samples=1):
+    """Coordinator: queues every ungenerated cell and every unscored output for workers to claim.
+
+    Cells and outputs already queued are left alone, so rerunning it after
+    adding prompts or tasks only adds the new work.
+    """
+    print("Queueing work...")
+    ledger = get_ledger()
+    cells = pending_cells(load_generation_grid(samples=samples), resume=True)
+    added = ledger.enqueue_jobs('generate', ((f"generate:{'|'.join(cell_key(cell))}", cell) for cell in cells))
+
+    output_files = find_output_files()
+    unscored = pending_output_files(output_files, resume=True) if output_files else []
+    added += ledger.enqueue_jobs('evaluate', ((f"evaluate:{os.path.basename(f)}", {'output_file': f}) for f in unscored))
+    print(f"Queued {added} jobs. Start workers with: python main.py worker")
+    print_queue_status()
+
+async def run_job(job):
+    """Runs one claimed job. Returns follow-up jobs to queue, or raises so the job is retried."""
+    payload = job['payload']
+    if job['kind'] == 'generate':
+        samples = await prompt_samples_async(payload['model'], payload['system_prompt'], payload['task_definition'],
+                                             payload.get('samples', 1), payload['style'], payload['task_file'],
+                                             payload.get('sample_indices'))
+        if not samples:
+            raise RuntimeError("empty generation")
+        output_files = [output_path(output_file) for output_file, _ in save_samples(payload, samples)]
+        return {'evaluate': [(f"evaluate:{os.path.basename(f)}", {'output_file': f}) for f in output_files]}
+
+    todo_list = read_results_section(payload['output_file'])
+    if not todo_list or not prescreen_one(payload['output_file'], todo_list):
+        return None
+    scores = await evaluate_todo_async(get_async_client(), todo_list)
+    if parse_score_string(scores) is None:
+        raise RuntimeError(f"malformed critic scores: {scores!r}")
+    record_scores(payload['output_file'], scores)
+    return None
+
+async def run_worker_async(worker, concurrency=DEFAULT_CONCURRENCY, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """Claims and runs queued jobs, keeping up to `concurrency` in flight, until the queue is drained.
+
+    Leases are renewed in the background while jobs run; if this process
+    dies its leases expire and another worker picks the jobs up.
+    """
+    import asyncio
+    ledger = get_ledger()
+    active = {}
+    counts = {'done': 0, 'failed': 0}
+
+    async def renew():
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            ledger.renew_leases(worker, list(active), lease_seconds)
+
+    async def handle(job):
+        try:
+            follow_up = await run_job(job)
+            ledger.complete_job(job['id'], worker, follow_up)
+            counts['done'] += 1
+        except Exception as e:
+            print(f"\nJob {job['id']} ({job['kind']}) failed: {e}")
+            ledger.fail_job(job['id'], worker, str(e))
+            counts['failed'] += 1
+
+    renewer = asyncio.create_task(renew())
+    try:
+        while True:
+            free = concurrency - len(active)
+            jobs = ledger.claim_jobs(worker, free, lease_seconds) if free else []
+            for job in jobs:
+                active[job['id']] = asyncio.create_task(handle(job))
+            if not active and not ledger.jobs_outstanding():
+                break
+            if active:
+                await asyncio.wait(active.values(), timeout=QUEUE_POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+            else:
+                # Other workers hold the remaining leases; wait for follow-ups or expired leases
+                await asyncio.sleep(QUEUE_POLL_INTERVAL)
+            active = {job_id: task for job_id, task in active.items() if not task.done()}
+    finally:
+        renewer.cancel()
+    return counts
+
+def run_worker(concurrency=DEFAULT_CONCURRENCY, lease_seconds=DEFAULT_LEASE_SECONDS, worker_id=None):
+    """Worker process: drains the shared work queue, then exports the scores."""
+    import asyncio
+    worker = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    print(f"Worker {worker} claiming jobs with concurrency {concurrency}...")
+
+    ledger = get_ledger()
+    ledger.start_run('worker')
+    start = time.perf_counter()
+    try:
+        counts = asyncio.run(run_worker_async(worker, concurrency, lease_seconds))
+        print(f"Worker {worker} finished: {counts['done']} jobs done, {counts['failed']} failed attempts "
+              f"in {time.perf_counter() - start:.1f}s.")
+    except KeyboardInterrupt:
+        print("\nWorker interrupted. Its leased jobs return to the queue once their leases expire.")
+    finally:
+        ledger.finish_run()
+    print_queue_status()
+    print_prescore_agreement()
+    save_scores_csv()
+
+#------------------------------------------------------------------------------
+# WATCH MODE
+#------------------------------------------------------------------------------
+
+def scan_sources(stat_cache, dirs=('prompts', 'tasks')):
+    """Maps every prompt and task file to a hash of the text the grid sends for it.
+
+    stat_cache holds {path: ((mtime, size), digest)} between scans so only
+    files whose mtime or size moved are read and hashed again.
+    """
+    digests = {}
+    for directory in dirs:
+        if not os.path.isdir(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith(".md"):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                stat = os.stat(path)
+                signature = (stat.st_mtime_ns, stat.st_size)
+                cached = stat_cache.get(path)
+                if cached is None or cached[0] != signature:
+                    with open(path, "r") as file:
+                        cached = (signature, hashlib.sha256(file.read().strip().encode()).hexdigest())
+                    stat_cache[path] = cached
+            except FileNotFoundError:
+                # Deleted between listing and reading; the next scan reports it
+                continue
+            digests[path] = cached[1]
+    return digests
+
+def retire_sources(paths):
+    """Retires the outputs and scores generated from the given prompt/task files; returns how many.
+
+    Text outputs are deleted. JSONL records stay in their shards until the
+    next --clear, but the ledger marks them retired so evaluate, enqueue and
+    resume skip them.
+    """
+    styles = [os.path.splitext(os.path.basename(path))[0] for path in paths if os.path.dirname(path) == 'prompts']
+    task_files = [path for path in paths if os.path.dirname(path) == 'tasks']
+    output_files = get_ledger().retire_outputs(styles, task_files)
+    if output_backend() == 'text':
+        for output_file in output_files:
+            filepath = os.path.join('output', output_file)
+            if os.path.exists(filepath):
+                os.remove(filepath)
+    return len(output_files)
+
+def print_source_changes(label, paths, limit=5):
+    if paths:
+        more = f" and {len(paths) - limit} more" if len(paths) > limit else ""
+        print(f"{label} ({len(paths)}): {', '.join(paths[:limit])}{more}")
+
+def sync_sources(recorded, current, concurrency=DEFAULT_CONCURRENCY, critic_concurrency=DEFAULT_CRITIC_CONCURRENCY,
+                 queue_size=DEFAULT_QUEUE_SIZE, samples=1):
+    """Brings outputs and scores in line with the current prompt and task files.
+
+    Outputs generated from a file whose hash changed, or from a deleted file,
+    are retired together with their scores. Then only the cells missing
+    outputs (those, plus any new file's) are regenerated and scored through
+    the streaming pipeline, and the score CSV and summary are refreshed.
+    """
+    import asyncio
+    changed = sorted(path for path in current if path in recorded and current[path] != recorded[path])
+    added = sorted(current.keys() - recorded.keys())
+    deleted = sorted(recorded.keys() - current.keys())
+    print_source_changes("Changed", changed)
+    print_source_changes("Added", added)
+    print_source_changes("Deleted", deleted)
+
+    ledger = get_ledger()
+    retired = retire_sources(changed + deleted)
+    if retired:
+        print(f"Retired {retired} stale outputs and their scores.")
+    ledger.record_sources(dict({path: current[path] for path in changed + added},
+                               **{path: None for path in deleted}))
+
+    cells, unscored = pending_pipeline_work(load_generation_grid(samples=samples), samples)
+    if cells or unscored:
+        print(f"Regenerating {len(cells)} cells and scoring {len(unscored)} leftover outputs...")
+        ledger.start_run('watch')
+        start = time.perf_counter()
+        try:
+            asyncio.run(run_pipeline_async(cells, concurrency, critic_concurrency, queue_size, unscored))
+        finally:
+            ledger.finish_run()
+        print(f"Updated in {time.perf_counter() - start:.1f}s.")
+    if retired or cells or unscored:
+        save_scores_csv()
+        if ledger.scored_outputs():
+            print(format_summary(summarize_scores(load_score_columns('analysis_scores.csv'))))
+
+def run_watch(concurrency=DEFAULT_CONCURRENCY, critic_concurrency=DEFAULT_CRITIC_CONCURRENCY,
+              queue_size=DEFAULT_QUEUE_SIZE, samples=1, interval=DEFAULT_WATCH_INTERVAL):
+    """Daemon: polls prompts/ and tasks/ and incrementally regenerates what an edit invalidates.
+
+    The first pass catches up on edits made while the daemon was not
+    running. After that a change is acted on once two consecutive scans
+    agree, so a file caught halfway through being saved is not used.
+    """
+    print(f"Watching prompts/ and tasks/ every {interval}s. Press Ctrl+C to stop.")
+    stat_cache = {}
+    recorded = get_ledger().source_digests()
+    try:
+        current = scan_sources(stat_cache)
+        sync_sources(recorded, current, concurrency, critic_concurrency, queue_size, samples)
+        recorded = previous = current
+        while True:
+            time.sleep(interval)
+            current = scan_sources(stat_cache)
+            if current != recorded and current == previous:
+                sync_sources(recorded, current, concurrency, critic_concurrency, queue_size, samples)
+                recorded = current
+                print("Watching for changes...")
+            previous = current
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+
+#------------------------------------------------------------------------------
+# BATCH EXECUTION
+#------------------------------------------------------------------------------
 
-def analyze_results():
+def make_batch_transport():
+    """Uses the real Batch API, or an in-process stand-in when running on the fake backend."""
+    if backend_name() == 'fake':
+        return LocalBatchTransport(get_fake_llm().respond_body)
+    return OpenAIBatchTransport(get_client())
+
+def run_generation_batch(transport, poll_interval=DEFAULT_POLL_INTERVAL, resume=False):
+    """Generates the grid through the batch API instead of synchronous calls."""
+    print("Running todo list generation in batch mode...")
+
+    cells = pending_cells(load_generation_grid(), resume)
+    requests = []
+    cached_results = {}
+    cache_keys = {}
+    for i, cell in enumerate(cells):
+        custom_id = f"gen-{i}"
+        # Same per-style output cap as the synchronous path
+        cap = output_cap(cell['style'])
+        params = {'max_tokens': cap} if cap else {}
+        cache_keys[custom_id] = response_cache.make_key(cell['model'], cell['system_prompt'], cell['task_definition'],
+                                                        **params)
+        cached = response_cache.get(cache_keys[custom_id])
+        if cached is not None:
+            cached_results[custom_id] = cached
+            continue
+        requests.append(build_request(custom_id, cell['model'], [
+            {"role": "system", "content": cell['system_prompt']},
+            {"role": "user", "content": cell['task_definition']}
+        ], **params))
+
+    print(f"{len(cached_results)} cells served from cache, {len(requests)} submitted.")
+    results = submit_batch(transport, requests, 'generate', poll_interval)
+
+    ledger = get_ledger()
+    ledger.start_run('generate')
+    for i, cell in enumerate(cells):
+        custom_id = f"gen-{i}"
+        if custom_id in cached_results:
+            content = cached_results[custom_id]
+        else:
+            content = results.get(custom_id) or ""
+            response_cache.put(cache_keys[custom_id], content)
+        save_to_file(cell['model'], cell['style'], cell['task_file'], cell['task_definition'], content)
+    ledger.finish_run()
+
+def run_critic_batch(transport, poll_interval=DEFAULT_POLL_INTERVAL, resume=False):
+    """Scores existing output files through the batch API."""
+    print("Running critic evaluation in batch mode...")
+
+    output_files = find_output_files()
+    if not output_files:
+        return
+    output_files = pending_output_files(output_files, resume)
+    output_files = prescreen_outputs(output_files)
+
+    model = critic_model()
+    system_prompt, params = critic_request()
+    requests = []
+    cache_keys = {}
+    results = {}
+    custom_ids = {}
+    todo_lists = {}
+    for i, (output_file, results_section) in enumerate(iter_results(output_files)):
+        custom_id = f"eval-{i}"
+        custom_ids[output_file] = custom_id
+        if not results_section:
+            continue
+        cache_keys[custom_id] = response_cache.make_key(model, system_prompt, results_section, **params)
+        cached = response_cache.get(cache_keys[custom_id])
+        if cached is not None:
+            results[custom_id] = cached
+            continue
+        todo_lists[custom_id] = results_section
+        requests.append(build_request(custom_id, model, [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": results_section}
+        ], **params))
+
+    print(f"{len(results)} outputs served from cache, {len(requests)} submitted.")
+    for custom_id, reply in submit_batch(transport, requests, 'evaluate', poll_interval).items():
+        scores = parse_critic_reply(reply)
+        if scores is None and reply:
+            # Rare invalid reply: rescore that one list synchronously instead of losing it
+            scores = evaluate_todo(get_client(), todo_lists[custom_id])
+        results[custom_id] = scores
+
+    ledger = get_ledger()
+    ledger.start_run('evaluate')
+    for output_file, custom_id in custom_ids.items():
+        scores = results.get(custom_id)
+        if not scores:
+            continue
+        response_cache.put(cache_keys[custom_id], scores)
+        try:
+            record_scores(output_file, scores)
+        except Exception as e:
+            print(f"Error processing {output_file}: {e}")
+    ledger.finish_run()
+    print_prescore_agreement()
+    save_scores_csv()
+
+def run_output_conversion():
+    """Copies output/*.txt into the JSONL store and moves their ledger rows to the record IDs.
+
+    Record IDs drop the .txt suffix, so without the move every converted
+    output would look ungenerated and unscored to --resume.
+    """
+    converted = convert_text_outputs('output')
+    stored = set(get_output_store().ids())
+    renames = {}
+    for path in glob.glob(os.path.join('output', '*.txt')):
+        output_file = os.path.basename(path)
+        if output_file[:-4] in stored:
+            renames[output_file] = output_file[:-4]
+    moved = get_ledger().rename_outputs(renames)
+    print(f"Converted {converted} output files into the JSONL store; moved {moved} ledger rows to their record IDs.")
+
+def analyze_results(local_only=False):
     """Analyzes the scores to determine the most effective prompt and model combinations."""
     if not os.path.exists('analysis_scores.csv'):
         print("No analysis scores found. Please run evaluation first.")
@@ -267,39 +1133,133 @@ def analyze_results():
     print("Analyzing prompt and model effectiveness...")
     
     try:
-        with open('analysis_scores.csv', 'r') as f:
-            csv_content = f.read()
-        
-        analysis = analyze_scores(client, csv_content)
-        if analysis:
-            print("\nAnalysis Results:")
-            print(analysis)
+        summary_text = format_summary(summarize_scores(load_score_columns('analysis_scores.csv')))
+        print("\nScore Summary:")
+        print(summary_text)
+
+        report = f"SCORE SUMMARY\n\n{summary_text}\n"
+        if not local_only:
+            analysis = analyze_scores(get_client(), summary_text)
+            if analysis:
+                print("\nAnalysis Results:")
+                print(analysis)
+                report += f"\nANALYSIS\n\n{analysis}\n"
             
-            # Save the analysis to a file
-            timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-            with open(f'analysis_report_{timestamp}.txt', 'w') as f:
-                f.write(analysis)
-            print(f"\nAnalysis saved to analysis_report_{timestamp}.txt")
+        # Save the analysis to a file
+        timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        with open(f'analysis_report_{timestamp}.txt', 'w') as f:
+            f.write(report)
+        print(f"\nAnalysis saved to analysis_report_{timestamp}.txt")
             
     except Exception as e:
         print(f"Error during analysis: {e}")
 
+def run_task_list_scoring(input_dir, workers, summary_only=False):
+    """Runs the TaskListProcessor pipeline, or just rebuilds its summary report."""
+    from task_list_scorer import TaskListProcessor, run_processor
+
+    processor = TaskListProcessor(workers, critic_model(), critic_constrained())
+    if summary_only:
+        processor.generate_summary_report()
+    else:
+        run_processor(processor, input_dir)
+
 #------------------------------------------------------------------------------
 # SCRIPT ENTRY POINT
 #------------------------------------------------------------------------------
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Todo List Generator and Critic')
-    parser.add_argument('mode', choices=['generate', 'evaluate', 'analyze'],
-                       help='Mode to run: "generate" for todo list generation, "evaluate" for running critic, "analyze" for analyzing prompt effectiveness')
-    parser.add_argument('--clear', action='store_true', help='Clear previous results before running. For generate: clears output directory. For evaluate: clears previous scores.')
+    parser.add_argument('mode', choices=['generate', 'evaluate', 'run', 'analyze', 'export-csv', 'convert-outputs',
+                                         'score-lists', 'summary', 'enqueue', 'worker', 'watch', 'prescore'],
+                       help='Mode to run: "generate" for todo list generation, "evaluate" for running critic, "run" for generating and scoring in one streaming pass, "analyze" for analyzing prompt effectiveness, "export-csv" for rewriting analysis_scores.csv from the run ledger, "convert-outputs" for copying output/*.txt into the JSONL store, "score-lists" for parsing and scoring task list files with TaskListProcessor, "summary" for rebuilding its evaluation_summary.json, "enqueue" for queueing pending generate/evaluate jobs in the run ledger, "worker" for claiming and running queued jobs (start any number of workers), "watch" for regenerating and rescoring only what changes in prompts/ and tasks/, "prescore" for structurally pre-scoring every output locally and comparing with the critic')
+    parser.add_argument('--clear', action='store_true', help='Clear previous results before running. For generate: clears output directory. For evaluate: clears previous scores. For run: clears both. For enqueue: clears both and the work queue.')
+    parser.add_argument('--backend', choices=BACKENDS, default=backend_name(), help='Model backend: "openai" for real calls, "fake" for a deterministic offline stand-in')
+    parser.add_argument('--adaptive', action='store_true', help='For generate: successive-halving search that drops losing prompt/model arms each round (also scores)')
+    parser.add_argument('--budget', type=int, default=DEFAULT_ADAPTIVE_BUDGET, help=f'For --adaptive: total model calls to spend, generation plus critic (default: {DEFAULT_ADAPTIVE_BUDGET})')
+    parser.add_argument('--keep-fraction', type=float, default=DEFAULT_KEEP_FRACTION, help=f'For --adaptive: fraction of arms kept after each round (default: {DEFAULT_KEEP_FRACTION})')
+    parser.add_argument('--initial-tasks', type=int, default=DEFAULT_INITIAL_TASKS, help=f'For --adaptive: tasks sampled per arm in the first round (default: {DEFAULT_INITIAL_TASKS})')
+    parser.add_argument('--samples', type=int, default=1, help='For generate/run/enqueue/watch: completions per (model, prompt, task) cell, requested together with n=K in one call (default: 1)')
+    parser.add_argument('--resume', action='store_true', help='Skip cells already generated and outputs already scored by an earlier, interrupted run')
+    parser.add_argument('--output-backend', choices=OUTPUT_BACKENDS, default='text', help='Where generated outputs live: "text" for output/*.txt files, "jsonl" for the sharded output_store/')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the on-disk response cache entirely')
+    parser.add_argument('--refresh', action='store_true', help='Ignore cached responses but store the fresh ones')
+    parser.add_argument('--batch', action='store_true', help='Submit generate/evaluate requests through the batch API and wait for the results')
+    parser.add_argument('--poll-interval', type=int, default=DEFAULT_POLL_INTERVAL, help=f'Seconds between batch status checks (default: {DEFAULT_POLL_INTERVAL})')
+    parser.add_argument('--pack-size', type=int, default=DEFAULT_PACK_SIZE, help='For evaluate: number of todo lists scored per critic request (default: 1, one request per list)')
+    parser.add_argument('--critic-concurrency', type=int, default=DEFAULT_CRITIC_CONCURRENCY, help=f'For run: number of concurrent critic workers (default: {DEFAULT_CRITIC_CONCURRENCY})')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help=f'For run: maximum generated lists waiting for the critic (default: {DEFAULT_QUEUE_SIZE})')
+    parser.add_argument('--lease-seconds', type=int, default=DEFAULT_LEASE_SECONDS, help=f'For worker: how long a claimed job stays reserved without a renewal (default: {DEFAULT_LEASE_SECONDS})')
+    parser.add_argument('--worker-id', help='For worker: name recorded on claimed jobs (default: hostname-pid)')
+    parser.add_argument('--watch-interval', type=float, default=DEFAULT_WATCH_INTERVAL, help=f'For watch: seconds between scans of prompts/ and tasks/ (default: {DEFAULT_WATCH_INTERVAL})')
+    parser.add_argument('--input-dir', default='input_tasks', help='For score-lists: directory of task list .txt files (default: input_tasks)')
+    parser.add_argument('--workers', type=int, default=8, help='For score-lists: parse/evaluate worker pool size (default: 8)')
+    parser.add_argument('--local-only', action='store_true', help='For analyze: print the local score summary without asking a model to interpret it')
+    parser.add_argument('--critic-model', help=f'Model used by the critic and by score-lists (default: {CRITIC_MODEL}, or {CONSTRAINED_CRITIC_MODEL} with --constrained-critic)')
+    parser.add_argument('--constrained-critic', action='store_true', help='Ask the critic for JSON-schema output with a tight max_tokens, validating and retrying invalid replies')
+    parser.add_argument('--prescore', action='store_true', help='Pre-score outputs structurally before the critic, store the pre-scores and skip junk lists')
+    parser.add_argument('--critic-top', type=float, help='With pre-scoring: send only this fraction of lists, best pre-scores first, to the critic (evaluate and --batch only)')
+    parser.add_argument('--critic-band', type=float, nargs=2, metavar=('LOW', 'HIGH'), help='With pre-scoring: send only lists whose pre-score (5-25) falls in this band to the critic')
+    parser.add_argument('--stream', action='store_true', help='Stream generations token by token and record time to first token and tokens/sec')
+    parser.add_argument('--max-output-tokens', type=int, help=f'Default cap on generated tokens per output; per-style caps in {STYLE_CAPS_FILE} take precedence (default: uncapped)')
+    parser.add_argument('--max-retries', type=int, default=DEFAULT_MAX_RETRIES, help=f'Retries for rate-limited or failed model calls, with jittered backoff (default: {DEFAULT_MAX_RETRIES})')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help=f'Maximum number of in-flight model requests during generation (default: {DEFAULT_CONCURRENCY})')
     
     args = parser.parse_args()
+    if args.samples > 1 and (args.batch or args.adaptive):
+        parser.error("--samples cannot be combined with --batch or --adaptive")
+    if args.constrained_critic and args.critic_model and not supports_structured_output(args.critic_model):
+        parser.error(f"--constrained-critic needs a model with structured outputs; {args.critic_model} has none")
+    if args.concurrency < 1 or args.critic_concurrency < 1:
+        parser.error("--concurrency and --critic-concurrency must be at least 1")
+    if args.samples < 1:
+        parser.error("--samples must be at least 1")
+    if not 0 < args.keep_fraction < 1:
+        parser.error("--keep-fraction must be between 0 and 1 (exclusive)")
+    if args.critic_top is not None and not 0 < args.critic_top <= 1:
+        parser.error("--critic-top must be a fraction between 0 and 1")
+    configure_backend(args.backend)
+    # Assumed per-model limits only describe OpenAI; other backends are throttled by their headers alone
+    configure_governor(max_retries=args.max_retries, assume_limits=args.backend == 'openai')
+    configure_streaming(args.stream, args.max_output_tokens, load_style_caps())
+    configure_critic(args.critic_model, args.constrained_critic)
+    configure_prescore(args.prescore, args.critic_top, args.critic_band)
+    configure_output(args.output_backend)
+    configure_cache(enabled=not args.no_cache, refresh=args.refresh)
     setup_directory_structure(args.clear, args.mode)  # Pass the mode
     
-    if args.mode == 'generate':
-        run_generation()
+    if args.mode == 'generate' and args.adaptive:
+        run_adaptive_generation(args.budget, args.keep_fraction, args.initial_tasks,
+                                args.concurrency, args.critic_concurrency)
+    elif args.mode == 'generate' and args.batch:
+        run_generation_batch(make_batch_transport(), args.poll_interval, args.resume)
+    elif args.mode == 'generate':
+        run_generation(args.concurrency, args.resume, args.samples)
+    elif args.mode == 'evaluate' and args.batch:
+        run_critic_batch(make_batch_transport(), args.poll_interval, args.resume)
     elif args.mode == 'evaluate':
-        run_critic()
+        run_critic(args.resume, args.pack_size)
+    elif args.mode == 'run':
+        run_pipeline(args.concurrency, args.critic_concurrency, args.queue_size, args.resume, args.samples)
+    elif args.mode == 'export-csv':
+        save_scores_csv()
+    elif args.mode == 'enqueue':
+        enqueue_work(args.samples)
+    elif args.mode == 'worker':
+        run_worker(args.concurrency, args.lease_seconds, args.worker_id)
+    elif args.mode == 'prescore':
+        run_prescoring()
+    elif args.mode == 'watch':
+        run_watch(args.concurrency, args.critic_concurrency, args.queue_size, args.samples, args.watch_interval)
+    elif args.mode in ('score-lists', 'summary'):
+        run_task_list_scoring(args.input_dir, args.workers, summary_only=args.mode == 'summary')
+    elif args.mode == 'convert-outputs':
+        run_output_conversion()
     else:
-        analyze_results()
\ No newline at end of file
+        analyze_results(args.local_only)
+
+    if args.mode in ('generate', 'evaluate', 'run', 'score-lists', 'worker', 'watch'):
+        response_cache.evict()
+        print(response_cache.summary())
+    if telemetry.records:
+        print(telemetry.summary())
@@ -0,0 +1,177 @@
+#==============================================================================
+# OUTPUT STORE
+# Append-only, sharded JSONL storage for generated todo lists
+#==============================================================================
+
+import glob
+import json
+import os
+import re
+import threading
+
+STORE_DIR = 'output_store'
+INDEX_NAME = 'index.jsonl'
+DEFAULT_MAX_SHARD_BYTES = 64 * 1024 * 1024
+OUTPUT_BACKENDS = ['text', 'jsonl']
+
+SCORES_LINE = re.compile(r'\nScores: [0-9,\s]*\n?$')
+
+def parse_output_text(content):
+    """Splits a legacy output/*.txt file into its fields.
+
+    The header fields come first and 'Results:' is matched only as the line
+    that follows the task definition, so todo lists that themselves contain
+    'Results:' or 'Scores:' are kept intact.
+    """
+    record = {}
+    header, separator, rest = content.partition('\nTask Definition: ')
+    if not separator:
+        raise ValueError("Missing 'Task Definition:' line")
+    for line in header.strip().splitlines():
+        key, _, value = line.partition(': ')
+        record[key.strip()] = value
+
+    task_definition, separator, results = rest.partition('\nResults: ')
+    if not separator:
+        raise ValueError("Missing 'Results:' line")
+
+    scores = None
+    match = SCORES_LINE.search(results)
+    if match:
+        scores = match.group(0).strip()[len('Scores: '):]
+        results = results[:match.start()]
+
+    return {
+        'model': record.get('Language Model', ''),
+        'style': record.get('System Prompt', ''),
+        'task_file': record.get('Task File', ''),
+        'task_definition': task_definition,
+        'results': results.strip(),
+        'scores': scores,
+        'sample': int(record.get('Sample', 0) or 0),
+    }
+
+class OutputStore:
+    """Appends records to rotating JSONL shards and keeps a side index of byte offsets.
+
+    Each record is written with a single O_APPEND write, so several processes
+    can append to the same store; the offset is taken from the position after
+    the write rather than computed in advance.
+    """
+
+    def __init__(self, root=STORE_DIR, max_shard_bytes=DEFAULT_MAX_SHARD_BYTES):
+        self.root = root
+        self.max_shard_bytes = max_shard_bytes
+        self.index_path = os.path.join(root, INDEX_NAME)
+        self._index = None
+        self._index_size = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _shards(self):
+        return sorted(glob.glob(os.path.join(self.root, 'shard-*.jsonl')))
+
+    def _current_shard(self):
+        shards = self._shards()
+        if shards and os.path.getsize(shards[-1]) < self.max_shard_bytes:
+            return shards[-1]
+        return os.path.join(self.root, f"shard-{len(shards):05d}.jsonl")
+
+    def append(self, record):
+        """Appends one record (which must carry an 'id') and indexes its location."""
+        line = (json.dumps(record) + '\n').encode('utf-8')
+        with self._lock:
+            shard = self._current_shard()
+            with open(shard, 'ab', buffering=0) as f:
+                f.write(line)
+                offset = f.tell() - len(line)
+            entry = {'id': record['id'], 'shard': os.path.basename(shard), 'offset': offset, 'length': len(line)}
+            with open(self.index_path, 'ab', buffering=0) as f:
+                f.write((json.dumps(entry) + '\n').encode('utf-8'))
+            if self._index is not None:
+                self._index[record['id']] = entry
+        return record['id']
+
+    def _load_index(self):
+        """Reads index lines added since the last call (the index is append-only too)."""
+        if self._index is None:
+            self._index = {}
+            self._index_size = 0
+        if not os.path.exists(self.index_path):
+            return self._index
+        with open(self.index_path, 'rb') as f:
+            f.seek(self._index_size)
+            data = f.read()
+        # Leave a partially written trailing line for the next call
+        complete = data[:data.rfind(b'\n') + 1]
+        for line in complete.splitlines():
+            entry = json.loads(line)
+            self._index[entry['id']] = entry
+        self._index_size += len(complete)
+        return self._index
+
+    def ids(self):
+        """All record IDs in append order."""
+        with self._lock:
+            return list(self._load_index())
+
+    def __contains__(self, record_id):
+        with self._lock:
+            return record_id in self._load_index()
+
+    def get(self, record_id):
+        """Seeks directly to one record."""
+        with self._lock:
+            entry = self._load_index()[record_id]
+        with open(os.path.join(self.root, entry['shard']), 'rb') as f:
+            f.seek(entry['offset'])
+            return json.loads(f.read(entry['length']))
+
+    def iter_records(self):
+        """Streams every record, reading each shard sequentially."""
+        for shard in self._shards():
+            with open(shard, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.endswith('\n'):
+                        yield json.loads(line)
+
+def convert_text_outputs(output_dir='output', store=None):
+    """Copies legacy output/*.txt files into the JSONL store. Returns the number converted."""
+    store = store or get_output_store()
+    existing = set(store.ids())
+    converted = 0
+    for path in sorted(glob.glob(os.path.join(output_dir, '*.txt'))):
+        record_id = os.path.splitext(os.path.basename(path))[0]
+        if record_id in existing:
+            continue
+        try:
+            with open(path, 'r') as f:
+                record = parse_output_text(f.read())
+        except (OSError, ValueError) as e:
+            print(f"Skipping {path}: {e}")
+            continue
+        record['id'] = record_id
+        store.append(record)
+        converted += 1
+    return converted
+
+_output = {'backend': 'text', 'store': None}
+
+def configure_output(backend='text'):
+    """Selects where generated outputs are written: output/*.txt files or the JSONL store."""
+    if backend not in OUTPUT_BACKENDS:
+        raise ValueError(f"Unknown output backend '{backend}'. Choose from: {', '.join(OUTPUT_BACKENDS)}")
+    _output['backend'] = backend
+
+def output_backend():
+    return _output['backend']
+
+def get_output_store():
+    """Returns the process-wide JSONL store, opening it on first use."""
+    if _output['store'] is None:
+        _output['store'] = OutputStore()
+    return _output['store']
+
+def close_output_store():
+    """Forgets the process-wide store so the next get_output_store() reopens it (e.g. after a chdir)."""
+    _output['store'] = None
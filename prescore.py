@@ -0,0 +1,108 @@
+#==============================================================================
+# STRUCTURAL PRE-SCORER
+# Scores todo list structure locally to triage outputs before the paid critic
+#==============================================================================
+
+import math
+import re
+
+# Numbered items and checkboxes are rewritten as '- ' bullets, the form parse_task_list() reads
+BULLET = re.compile(r'^(\s*)(?:[-*•+]|\d+[.)])\s+(?:\[[ xX]?\]\s*)?')
+TIME_MARKER = re.compile(
+    r'\b\d{1,2}(?::\d{2})?\s*(?:am|pm)\b'
+    r'|\b\d+(?:\.\d+)?\s*(?:-\s*\d+\s*)?(?:min|mins|minutes?|hrs?|hours?|h|days?|weeks?)\b'
+    r'|\b(?:today|tomorrow|tonight|morning|afternoon|evening|weekend|deadline|due|'
+    r'monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b', re.IGNORECASE)
+PRIORITY_MARKER = re.compile(
+    r'\b(?:high|medium|low|top)[- ]priority\b|\bpriorit(?:y|ies|ize)\b|\burgent\b|\bimportant\b'
+    r'|\bP[0-3]\b|!{2,}|\((?:high|medium|low)\)', re.IGNORECASE)
+MIN_ITEMS = 1
+USEFUL_ITEMS = 3
+MAX_ITEMS = 40
+WORDS_PER_ITEM = (3, 25)
+# Component names mirror the five critic criteria so the pre-score lands on the same 5-25 scale
+COMPONENTS = ['clarity', 'actionability', 'priority', 'timeframes', 'breakdown']
+
+_prescore = {'enabled': False, 'top': None, 'band': None}
+
+def configure_prescore(enabled=False, top=None, band=None):
+    """Applies the --prescore / --critic-top / --critic-band switches; either triage option enables pre-scoring."""
+    _prescore['enabled'] = enabled or top is not None or band is not None
+    _prescore['top'] = top
+    _prescore['band'] = tuple(band) if band else None
+
+def prescore_enabled():
+    return _prescore['enabled']
+
+def structural_features(todo_list):
+    """Counts items, nesting levels, time/duration and priority markers, and length of a todo list."""
+    from task_list_scorer import TaskListProcessor
+
+    lines = []
+    indents = set()
+    priority_heading = False
+    for line in (todo_list or "").split('\n'):
+        match = BULLET.match(line)
+        if match:
+            indents.add(len(match.group(1).expandtabs(4)))
+            line = "- " + line[match.end():]
+        elif PRIORITY_MARKER.search(line):
+            priority_heading = True
+        lines.append(line)
+    tasks = TaskListProcessor.parse_task_list("\n".join(lines))['tasks']
+
+    items = len(tasks)
+    words = len((todo_list or "").split())
+    return {
+        'items': items,
+        'depth': len(indents) if items else 0,
+        'timed': sum(1 for task in tasks if TIME_MARKER.search(task)) / items if items else 0.0,
+        'prioritized': (1.0 if priority_heading else
+                        sum(1 for task in tasks if PRIORITY_MARKER.search(task)) / items if items else 0.0),
+        'words': words,
+        'words_per_item': sum(len(task.split()) for task in tasks) / items if items else 0.0,
+    }
+
+def prescore_todo(todo_list):
+    """Returns the structural features of a todo list plus its pre-score and whether it is junk.
+
+    Each component is 0-1 and maps to 1-5 like a critic criterion, so the
+    pre-score is directly comparable with the critic's total (5-25).
+    """
+    features = structural_features(todo_list)
+    items = features['items']
+    low, high = WORDS_PER_ITEM
+    words_per_item = features['words_per_item']
+    components = {
+        'clarity': (1.0 if low <= words_per_item <= high else
+                    words_per_item / low if words_per_item < low else high / words_per_item),
+        'actionability': min(items / USEFUL_ITEMS, 1.0) * min(MAX_ITEMS / items, 1.0) if items else 0.0,
+        'priority': features['prioritized'],
+        'timeframes': features['timed'],
+        'breakdown': 1.0 if features['depth'] >= 2 else 0.4 if items else 0.0,
+    }
+    return {
+        'features': features,
+        'prescore': round(sum(1 + 4 * components[name] for name in COMPONENTS), 1),
+        'rejected': items < MIN_ITEMS,
+    }
+
+def critic_wanted(result):
+    """True if a pre-scored list is neither junk nor outside the --critic-band."""
+    if result['rejected']:
+        return False
+    band = _prescore['band']
+    return band is None or band[0] <= result['prescore'] <= band[1]
+
+def select_for_critic(results):
+    """Picks the keys of {key: prescore_todo() result} that should still go to the critic.
+
+    Junk and lists outside the band are dropped; with --critic-top only the
+    best-scoring fraction of the rest is kept.
+    """
+    wanted = [key for key, result in results.items() if critic_wanted(result)]
+    top = _prescore['top']
+    if top is not None and wanted:
+        wanted.sort(key=lambda key: -results[key]['prescore'])
+        wanted = wanted[:max(1, math.ceil(len(wanted) * top))]
+    return set(wanted)
@@ -0,0 +1,82 @@
+#==============================================================================
+# STREAMING GENERATION
+# Consumes completions as they arrive, times the first token and caps output length
+#==============================================================================
+
+import inspect
+import json
+import os
+import time
+
+STYLE_CAPS_FILE = 'style_caps.json'
+
+_streaming = {'enabled': False, 'default_cap': None, 'caps': {}}
+
+def load_style_caps(path=STYLE_CAPS_FILE):
+    """Reads {prompt style: max output tokens} from a JSON file; {} if it does not exist."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return {style: int(cap) for style, cap in json.load(f).items()}
+
+def configure_streaming(enabled=False, default_cap=None, caps=None):
+    """Applies the --stream / --max-output-tokens switches and the per-style caps."""
+    _streaming['enabled'] = enabled
+    _streaming['default_cap'] = default_cap
+    _streaming['caps'] = dict(caps or {})
+
+def streaming_enabled():
+    return _streaming['enabled']
+
+def output_cap(style):
+    """Maximum output tokens for a prompt style: its own cap, else the default; None means uncapped."""
+    return _streaming['caps'].get(style, _streaming['default_cap'])
+
+async def _close(stream):
+    close = getattr(stream, 'close', None)
+    if close is not None:
+        result = close()
+        if inspect.isawaitable(result):
+            await result
+
+async def consume_stream(stream, call, samples=1, cap=None, settle=None):
+    """Reads a streamed completion and returns the text of each of its `samples` choices.
+
+    Fills the telemetry record with time to first token (measured from the
+    start of the call, minus any rate-limit wait), whether the output was
+    capped, and the completion token count when the stream reports no usage.
+    Each content chunk counts as one token; once every choice has reached
+    `cap` tokens the stream is closed so a runaway completion stops early.
+    `settle(total_tokens, completion_tokens)` is called at the end, even on
+    error, with the reported usage (or the counted tokens) so the rate-limit
+    governor can release what it reserved for the call.
+    """
+    parts = [[] for _ in range(samples)]
+    counts = [0] * samples
+    total_tokens = None
+    try:
+        async for chunk in stream:
+            usage = getattr(chunk, 'usage', None)
+            if usage is not None:
+                call.usage(usage)
+                total_tokens = getattr(usage, 'total_tokens', None)
+            for choice in chunk.choices:
+                content = choice.delta.content
+                if content:
+                    if call['ttft'] is None:
+                        call['ttft'] = time.time() - call['started_at'] - call['throttled']
+                    parts[choice.index].append(content)
+                    counts[choice.index] += 1
+                if choice.finish_reason == 'length':
+                    call['capped'] = True
+            if cap and all(count >= cap for count in counts):
+                call['capped'] = True
+                await _close(stream)
+                break
+    finally:
+        if settle is not None:
+            settle(total_tokens, sum(counts))
+
+    if not call['completion_tokens']:
+        call['completion_tokens'] = sum(counts)
+    return ["".join(p) for p in parts]
@@ -1,21 +1,63 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import json
-import os
 from pathlib import Path
-from typing import Dict, List, Union
-from openai import OpenAI
-from dotenv import load_dotenv
+from typing import Dict, List, Optional, Union
 import re
+from cache import response_cache
+from telemetry import telemetry
+from governor import governor
+from backends import get_client
+from critic import supports_structured_output, CONSTRAINED_CRITIC_MODEL
 
-# Load environment variables
-load_dotenv()
+DEFAULT_WORKERS = 8
+DEFAULT_MODEL = "gpt-4"
+MANIFEST_NAME = ".manifest.json"
+MAX_EVALUATION_ATTEMPTS = 2
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+EVALUATION_CRITERIA = [
+    "Time-Bound but Flexible Timing",
+    "Energy-State Matching",
+    "Sensory-Aware Task Grouping",
+    "Momentum-Based Sequencing",
+    "Concrete Next Actions",
+    "Built-In Recovery Planning",
+    "Overall Synergy Across Tasks"
+]
+# What the system prompt asks for on each line: a 1-5 score or true/false
+EVALUATION_KINDS = ['score', 'bool', 'score', 'bool', 'bool', 'score', 'score']
+EVALUATION_KEYS = ['timing', 'energy_matching', 'sensory_grouping', 'momentum', 'next_actions', 'recovery', 'synergy']
+EVALUATION_RESPONSE_FORMAT = {
+    'type': 'json_schema',
+    'json_schema': {
+        'name': 'task_list_evaluation',
+        'strict': True,
+        'schema': {
+            'type': 'object',
+            'properties': {
+                key: {'type': 'integer', 'enum': [1, 2, 3, 4, 5]} if kind == 'score' else {'type': 'boolean'}
+                for key, kind in zip(EVALUATION_KEYS, EVALUATION_KINDS)
+            },
+            'required': EVALUATION_KEYS,
+            'additionalProperties': False,
+        },
+    },
+}
+CONSTRAINED_MAX_TOKENS = 80
+LIST_NUMBER = re.compile(r'^\s*\d+\s*[.):]\s*')
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
 
 class TaskListProcessor:
-    def __init__(self):
+    def __init__(self, max_workers: int = DEFAULT_WORKERS, model: Optional[str] = None, constrained: bool = False):
+        self.max_workers = max_workers
+        self.model = model or (CONSTRAINED_CRITIC_MODEL if constrained else DEFAULT_MODEL)
+        self.constrained = constrained
         self.task_list_dir = Path("task_list_results")
         self.scoring_dir = Path("task_list_result_scoring")
+        self.summary_file = Path("evaluation_summary.json")
         self.system_prompt = """You are a to-do-list evaluation critic. Your role is to review the to-do lists written by another large language model and make sure they meet the following criteria:
 1. Time-Bound but Flexible Timing
 2. Energy-State Matching
@@ -40,7 +82,8 @@ Please present your evaluations as a list from 1-7, exactly as above. **Do not l
         self.task_list_dir.mkdir(exist_ok=True)
         self.scoring_dir.mkdir(exist_ok=True)
 
-    def parse_task_list(self, content: str) -> Dict:
+    @staticmethod
+    def parse_task_list(content: str) -> Dict:
         """
         Parse the task list content and extract tasks.
         Implement custom parsing logic based on your file format.
@@ -63,129 +106,252 @@ Please present your evaluations as a list from 1-7, exactly as above. **Do not l
             
         return {"tasks": tasks}
 
-    def process_files(self, input_dir: str) -> None:
-        """Process all task list files in the input directory."""
+    def _load_manifest(self, directory: Path) -> Dict[str, str]:
+        """Maps output file names in directory to the hash of the input they were built from."""
+        manifest_path = directory / MANIFEST_NAME
+        if not manifest_path.exists():
+            return {}
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except ValueError:
+            return {}
+
+    def _save_manifest(self, directory: Path, manifest: Dict[str, str]) -> None:
+        manifest_path = directory / MANIFEST_NAME
+        tmp_path = manifest_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        tmp_path.replace(manifest_path)
+
+    def _parse_file(self, file_path: Path, manifest: Dict[str, str]) -> Optional[Path]:
+        """Parses one input file unless its parsed JSON is already up to date."""
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        output_file = self.task_list_dir / f"{file_path.stem}_parsed.json"
+        source_hash = content_hash(content)
+        if manifest.get(output_file.name) == source_hash and output_file.exists():
+            return None
+
+        # Parse and convert to JSON
+        task_data = self.parse_task_list(content)
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(task_data, f, indent=2)
+        manifest[output_file.name] = source_hash
+        print(f"Processed {file_path.name} -> {output_file.name}")
+        return output_file
+
+    def process_files(self, input_dir: str) -> List[Path]:
+        """Process new or changed task list files in the input directory on a worker pool."""
         input_path = Path(input_dir)
-        
-        for file_path in input_path.glob('*.txt'):  # Adjust file extension as needed
+        file_paths = list(input_path.glob('*.txt'))  # Adjust file extension as needed
+        manifest = self._load_manifest(self.task_list_dir)
+
+        def parse(file_path):
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # Parse and convert to JSON
-                task_data = self.parse_task_list(content)
-                output_file = self.task_list_dir / f"{file_path.stem}_parsed.json"
-                
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    json.dump(task_data, f, indent=2)
-                
-                print(f"Processed {file_path.name} -> {output_file.name}")
-                
+                return self._parse_file(file_path, manifest)
             except Exception as e:
                 print(f"Error processing {file_path.name}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            updated = [path for path in pool.map(parse, file_paths) if path]
+
+        self._save_manifest(self.task_list_dir, manifest)
+        print(f"Parsed {len(updated)} files, {len(file_paths) - len(updated)} unchanged or failed.")
+        return updated
+
+    def _request_params(self) -> Dict:
+        """Extra create() parameters: a JSON schema and a tight max_tokens in constrained mode."""
+        if not self.constrained:
+            return {}
+        return {'response_format': EVALUATION_RESPONSE_FORMAT, 'max_tokens': CONSTRAINED_MAX_TOKENS, 'temperature': 0}
+
+    def normalize_evaluation(self, reply: str) -> Optional[str]:
+        """Validate a critic reply and return it as the canonical seven-line evaluation, or None."""
+        if self.constrained:
+            try:
+                data = json.loads(reply)
+                values = [data[key] for key in EVALUATION_KEYS]
+            except (TypeError, ValueError, KeyError):
+                return None
+        else:
+            scores = self.parse_evaluation_scores(reply or "")
+            values = [scores.get(criterion) for criterion in EVALUATION_CRITERIA]
+
+        for value, kind in zip(values, EVALUATION_KINDS):
+            if kind == 'bool' and type(value) is not bool:
+                return None
+            if kind == 'score' and (type(value) is not int or not 1 <= value <= 5):
+                return None
+        return "\n".join(f"{i}. {str(value).lower()}" for i, value in enumerate(values, start=1))
 
     def evaluate_task_list(self, task_list: Dict) -> str:
-        """Send task list to OpenAI for evaluation."""
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4",  # or your preferred model
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": json.dumps(task_list, indent=2)}
-                ]
-            )
-            return response.choices[0].message.content
-            
-        except Exception as e:
-            print(f"Error during evaluation: {e}")
-            return ""
+        """Send task list to the critic model for evaluation; invalid replies are retried."""
+        user_content = json.dumps(task_list, indent=2)
+        params = self._request_params()
+        cache_key = response_cache.make_key(self.model, self.system_prompt, user_content, **params)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        for _ in range(MAX_EVALUATION_ATTEMPTS):
+            try:
+                with telemetry.track('score_list', self.model) as call:
+                    response = governor.create(get_client(), call,
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": self.system_prompt},
+                            {"role": "user", "content": user_content}
+                        ],
+                        **params
+                    )
+                    call.usage(response.usage)
+                    evaluation = self.normalize_evaluation(response.choices[0].message.content)
+                    if evaluation is None:
+                        call['error'] = 'InvalidReply'
+            except Exception as e:
+                print(f"Error during evaluation: {e}")
+                return ""
+            if evaluation is not None:
+                response_cache.put(cache_key, evaluation)
+                return evaluation
 
-    def process_evaluations(self) -> None:
-        """Process all task lists and generate evaluations."""
-        for json_file in self.task_list_dir.glob('*.json'):
+        print(f"Error during evaluation: no valid evaluation after {MAX_EVALUATION_ATTEMPTS} attempts")
+        return ""
+
+    def _evaluate_file(self, json_file: Path, manifest: Dict[str, str]) -> Optional[Path]:
+        """Evaluates one parsed task list unless its evaluation is already up to date."""
+        with open(json_file, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        output_file = self.scoring_dir / f"{json_file.stem}_evaluation.txt"
+        # Evaluations made with another critic model, mode or prompt are stale too
+        source_hash = content_hash("\n".join([self.model, str(self.constrained), self.system_prompt, content]))
+        if manifest.get(output_file.name) == source_hash and output_file.exists():
+            return None
+
+        # Get evaluation
+        evaluation = self.evaluate_task_list(json.loads(content))
+        
+        # Save evaluation
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write(evaluation)
+
+        # Failed evaluations come back empty and are retried on the next run
+        if evaluation:
+            manifest[output_file.name] = source_hash
+        print(f"Evaluated {json_file.name} -> {output_file.name}")
+        return output_file
+
+    def process_evaluations(self) -> List[Path]:
+        """Evaluate new or changed task lists, with at most max_workers requests in flight."""
+        json_files = list(self.task_list_dir.glob('*_parsed.json'))
+        manifest = self._load_manifest(self.scoring_dir)
+
+        def evaluate(json_file):
             try:
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    task_list = json.load(f)
-                
-                # Get evaluation
-                evaluation = self.evaluate_task_list(task_list)
-                
-                # Save evaluation
-                output_file = self.scoring_dir / f"{json_file.stem}_evaluation.txt"
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    f.write(evaluation)
-                
-                print(f"Evaluated {json_file.name} -> {output_file.name}")
-                
+                return self._evaluate_file(json_file, manifest)
             except Exception as e:
                 print(f"Error evaluating {json_file.name}: {e}")
+                return None
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                updated = [path for path in pool.map(evaluate, json_files) if path]
+        finally:
+            self._save_manifest(self.scoring_dir, manifest)
+        print(f"Evaluated {len(updated)} task lists, {len(json_files) - len(updated)} unchanged or failed.")
+        return updated
 
     def parse_evaluation_scores(self, evaluation: str) -> Dict[str, Union[int, bool]]:
         """Parse the evaluation text into structured data."""
-        lines = evaluation.strip().split('\n')
+        lines = [line for line in evaluation.strip().split('\n') if line.strip()]
         scores = {}
         
-        criteria = [
-            "Time-Bound but Flexible Timing",
-            "Energy-State Matching",
-            "Sensory-Aware Task Grouping",
-            "Momentum-Based Sequencing",
-            "Concrete Next Actions",
-            "Built-In Recovery Planning",
-            "Overall Synergy Across Tasks"
-        ]
-        
         for i, line in enumerate(lines):
-            if i < len(criteria):
-                # Extract score or boolean based on the criteria
-                values = re.findall(r'\d+|true|false', line.lower())
+            if i < len(EVALUATION_CRITERIA):
+                # Drop the "1." list number, then extract the score or boolean
+                values = re.findall(r'\d+|true|false', LIST_NUMBER.sub('', line).lower())
                 if values:
-                    if criteria[i] in ["Concrete Next Actions"]:
-                        scores[criteria[i]] = values[0] == 'true'
+                    if EVALUATION_CRITERIA[i] in ["Concrete Next Actions"]:
+                        scores[EVALUATION_CRITERIA[i]] = values[0] == 'true'
                     else:
-                        scores[criteria[i]] = int(values[0]) if values[0].isdigit() else values[0] == 'true'
+                        scores[EVALUATION_CRITERIA[i]] = int(values[0]) if values[0].isdigit() else values[0] == 'true'
         
         return scores
 
-    def generate_summary_report(self) -> None:
-        """Generate a summary report of all evaluations."""
-        all_scores = []
+    def _summarize_file(self, eval_file: Path) -> Dict[str, Union[int, bool, str]]:
+        with open(eval_file, 'r', encoding='utf-8') as f:
+            evaluation = f.read()
         
-        for eval_file in self.scoring_dir.glob('*_evaluation.txt'):
+        scores = self.parse_evaluation_scores(evaluation)
+        scores['file_name'] = eval_file.stem
+        return scores
+
+    def generate_summary_report(self, updated: Optional[List[Path]] = None) -> None:
+        """Generate or incrementally update the summary report of all evaluations.
+
+        When `updated` lists the evaluation files that changed and a summary
+        already exists, only those files are re-read; entries for evaluations
+        that no longer exist are dropped.
+        """
+        entries = {}
+        if updated is not None and self.summary_file.exists():
+            with open(self.summary_file, 'r', encoding='utf-8') as f:
+                entries = {entry['file_name']: entry for entry in json.load(f)}
+            existing = {path.stem for path in self.scoring_dir.glob('*_evaluation.txt')}
+            entries = {name: entry for name, entry in entries.items() if name in existing}
+            eval_files = updated
+        else:
+            eval_files = list(self.scoring_dir.glob('*_evaluation.txt'))
+
+        for eval_file in eval_files:
             try:
-                with open(eval_file, 'r', encoding='utf-8') as f:
-                    evaluation = f.read()
-                
-                scores = self.parse_evaluation_scores(evaluation)
-                scores['file_name'] = eval_file.stem
-                all_scores.append(scores)
-                
+                entries[eval_file.stem] = self._summarize_file(eval_file)
             except Exception as e:
                 print(f"Error processing evaluation {eval_file.name}: {e}")
 
         # Generate summary report
-        summary_file = Path("evaluation_summary.json")
-        with open(summary_file, 'w', encoding='utf-8') as f:
-            json.dump(all_scores, f, indent=2)
+        tmp_file = self.summary_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(sorted(entries.values(), key=lambda entry: entry['file_name']), f, indent=2)
+        tmp_file.replace(self.summary_file)
         
-        print(f"Generated summary report: {summary_file}")
+        print(f"Generated summary report: {self.summary_file} ({len(eval_files)} evaluations updated)")
 
-def main():
-    processor = TaskListProcessor()
-    
+def run_processor(processor: TaskListProcessor, input_dir: str) -> None:
+    """Parse, evaluate and summarize every new or changed task list in input_dir."""
     # Process input files
     print("Processing input files...")
-    processor.process_files("input_tasks")  # Adjust directory name as needed
+    processor.process_files(input_dir)
     
     # Generate evaluations
     print("\nGenerating evaluations...")
-    processor.process_evaluations()
+    updated = processor.process_evaluations()
     
     # Create summary report
     print("\nGenerating summary report...")
-    processor.generate_summary_report()
+    processor.generate_summary_report(updated)
+
+def main():
+    parser = argparse.ArgumentParser(description='Parse, evaluate and summarize task lists (also available as "main.py score-lists")')
+    parser.add_argument('input_dir', nargs='?', default="input_tasks", help='Directory of task list .txt files')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help=f'Parse/evaluate worker pool size (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--critic-model', help=f'Model that evaluates the task lists (default: {DEFAULT_MODEL}, or {CONSTRAINED_CRITIC_MODEL} with --constrained-critic)')
+    parser.add_argument('--constrained-critic', action='store_true', help='Ask for JSON-schema output with a tight max_tokens, validating and retrying invalid replies')
+    args = parser.parse_args()
+    if args.constrained_critic and args.critic_model and not supports_structured_output(args.critic_model):
+        parser.error(f"--constrained-critic needs a model with structured outputs; {args.critic_model} has none")
+
+    run_processor(TaskListProcessor(args.workers, args.critic_model, args.constrained_critic), args.input_dir)
     
+    response_cache.evict()
+    print(response_cache.summary())
+    if telemetry.records:
+        print(telemetry.summary())
     print("\nProcessing complete!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
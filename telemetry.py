@@ -0,0 +1,180 @@
+#==============================================================================
+# TELEMETRY
+# Per-call latency, token, cost and failure records for every model call
+#==============================================================================
+
+from contextlib import contextmanager
+import datetime
+import json
+import math
+import os
+import threading
+import time
+
+METRICS_DIR = 'metrics'
+
+# USD per million tokens: (input, cached input, output)
+MODEL_PRICES = {
+    'gpt-4': (30.00, 30.00, 60.00),
+    'gpt-4o': (2.50, 1.25, 10.00),
+    'gpt-4o-mini': (0.15, 0.075, 0.60),
+    'gpt-3.5-turbo': (0.50, 0.50, 1.50),
+}
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def estimate_cost(model, prompt_tokens, cached_tokens, completion_tokens):
+    """Estimated USD cost of one call; 0.0 for models without a known price."""
+    if model not in MODEL_PRICES:
+        return 0.0
+    input_price, cached_price, output_price = MODEL_PRICES[model]
+    uncached = max(prompt_tokens - cached_tokens, 0)
+    return (uncached * input_price + cached_tokens * cached_price + completion_tokens * output_price) / 1_000_000
+
+def cache_savings(model, cached_tokens):
+    """USD saved by serving cached_tokens from the provider prompt cache instead of full price."""
+    if model not in MODEL_PRICES:
+        return 0.0
+    input_price, cached_price, _ = MODEL_PRICES[model]
+    return cached_tokens * (input_price - cached_price) / 1_000_000
+
+class CallRecord(dict):
+    """One model call. Stages call .usage() with completion.usage once the response arrives."""
+
+    def usage(self, usage):
+        if usage is None:
+            return
+        details = getattr(usage, 'prompt_tokens_details', None)
+        self['prompt_tokens'] = getattr(usage, 'prompt_tokens', 0) or 0
+        self['completion_tokens'] = getattr(usage, 'completion_tokens', 0) or 0
+        self['cached_tokens'] = (getattr(details, 'cached_tokens', 0) or 0) if details else 0
+
+class Telemetry:
+    """Collects call records, appends them to a JSONL metrics log and summarizes them."""
+
+    def __init__(self, metrics_dir=METRICS_DIR):
+        self.metrics_dir = metrics_dir
+        self.records = []
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _write(self, record):
+        with self._lock:
+            self.records.append(record)
+            if self._file is None:
+                os.makedirs(self.metrics_dir, exist_ok=True)
+                timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+                self._file = open(os.path.join(self.metrics_dir, f"calls_{timestamp}_{os.getpid()}.jsonl"), 'a')
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+
+    @contextmanager
+    def track(self, stage, model, style=None, task=None):
+        """Times the enclosed model call and records it, including the error class if it raises."""
+        call = CallRecord(
+            stage=stage, model=model, style=style, task=task,
+            started_at=time.time(), prompt_tokens=0, completion_tokens=0, cached_tokens=0, error=None,
+            retries=0, throttled=0.0, ttft=None, capped=False,
+        )
+        start = time.perf_counter()
+        try:
+            yield call
+        except BaseException as e:
+            call['error'] = type(e).__name__
+            raise
+        finally:
+            call['latency'] = time.perf_counter() - start
+            call['cost'] = estimate_cost(model, call['prompt_tokens'], call['cached_tokens'], call['completion_tokens'])
+            self._write(dict(call))
+
+    def reset(self):
+        """Drops collected records and closes the metrics log."""
+        with self._lock:
+            self.records = []
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def summary(self):
+        """End-of-run report: per-stage timing, latency percentiles, tokens, cost, retries and failures."""
+        if not self.records:
+            return ""
+
+        lines = ["Model call telemetry:",
+                 f"  {'stage':<10} {'calls':>6} {'errors':>6} {'retries':>7} {'wait s':>7} {'wall s':>8} "
+                 f"{'p50 s':>7} {'p95 s':>7} {'p99 s':>7} "
+                 f"{'in tok':>9} {'cached':>8} {'out tok':>8} {'cost $':>8}"]
+        by_stage = {}
+        for record in self.records:
+            by_stage.setdefault(record['stage'], []).append(record)
+
+        for stage, records in by_stage.items():
+            latencies = [r['latency'] for r in records]
+            wall = max(r['started_at'] + r['latency'] for r in records) - min(r['started_at'] for r in records)
+            lines.append(
+                f"  {stage:<10} {len(records):>6} {sum(1 for r in records if r['error']):>6} "
+                f"{sum(r['retries'] for r in records):>7} {sum(r['throttled'] for r in records):>7.1f} {wall:>8.1f} "
+                f"{percentile(latencies, 50):>7.2f} {percentile(latencies, 95):>7.2f} {percentile(latencies, 99):>7.2f} "
+                f"{sum(r['prompt_tokens'] for r in records):>9} {sum(r['cached_tokens'] for r in records):>8} "
+                f"{sum(r['completion_tokens'] for r in records):>8} {sum(r['cost'] for r in records):>8.3f}"
+            )
+
+        # Requests sharing a (model, prompt style) share a system prompt prefix, so
+        # this table doubles as the provider prompt-cache report per prefix group
+        by_combo = {}
+        for record in self.records:
+            if record['style']:
+                by_combo.setdefault((record['model'], record['style']), []).append(record)
+        if by_combo:
+            lines.append(f"  {'model / prompt style':<50} {'calls':>6} {'p50 s':>7} {'p95 s':>7} {'cost $':>8} "
+                         f"{'cached %':>9} {'hit p50':>8} {'miss p50':>9} {'saved $':>8}")
+            ranked = sorted(by_combo.items(), key=lambda item: -percentile([r['latency'] for r in item[1]], 50))
+            for (model, style), records in ranked:
+                latencies = [r['latency'] for r in records]
+                prompt_tokens = sum(r['prompt_tokens'] for r in records)
+                cached_tokens = sum(r['cached_tokens'] for r in records)
+                hits = [r['latency'] for r in records if r['cached_tokens']]
+                misses = [r['latency'] for r in records if not r['cached_tokens']]
+                lines.append(
+                    f"  {model + ' / ' + style:<50} {len(records):>6} {percentile(latencies, 50):>7.2f} "
+                    f"{percentile(latencies, 95):>7.2f} {sum(r['cost'] for r in records):>8.3f} "
+                    f"{(cached_tokens / prompt_tokens * 100 if prompt_tokens else 0):>8.1f}% "
+                    f"{percentile(hits, 50):>8.2f} {percentile(misses, 50):>9.2f} "
+                    f"{cache_savings(model, cached_tokens):>8.3f}"
+                )
+
+        # Streamed calls: time to first token and generation speed once tokens flow
+        by_stream = {}
+        for record in self.records:
+            if record.get('ttft') is not None:
+                by_stream.setdefault((record['model'], record['style'] or record['stage']), []).append(record)
+        if by_stream:
+            lines.append(f"  {'streamed: model / prompt style':<50} {'calls':>6} {'ttft p50':>9} {'ttft p95':>9} "
+                         f"{'tok/s p50':>10} {'capped':>7}")
+            for (model, style), records in sorted(by_stream.items()):
+                ttfts = [r['ttft'] for r in records]
+                rates = [r['completion_tokens'] / (r['latency'] - r['throttled'] - r['ttft'])
+                         for r in records if r['latency'] - r['throttled'] - r['ttft'] > 0]
+                lines.append(
+                    f"  {model + ' / ' + style:<50} {len(records):>6} {percentile(ttfts, 50):>9.3f} "
+                    f"{percentile(ttfts, 95):>9.3f} {percentile(rates, 50):>10.1f} "
+                    f"{sum(1 for r in records if r['capped']):>7}"
+                )
+
+        errors = {}
+        for record in self.records:
+            if record['error']:
+                errors[record['error']] = errors.get(record['error'], 0) + 1
+        if errors:
+            lines.append("  Failures: " + ", ".join(f"{name} x{count}" for name, count in sorted(errors.items())))
+        if self._file is not None:
+            lines.append(f"  Per-call records: {self._file.name}")
+        return "\n".join(lines)
+
+telemetry = Telemetry()